@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
@@ -9,6 +8,22 @@ import os
 from datetime import datetime, timedelta
 import time
 import math
+import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from market_data import (get_fetcher, fetch_many, fetch_as_completed, TokenBucket, RateLimitedFetcher,
+                         FetchCoordinator, compact_ohlcv, frame_nbytes, INTERVAL_MINUTES)
+from bar_store import BarStore
+from stock_search import StockSearchIndex
+from universe import load_universe, build_stock_info_map, lookup_stock_info
+from vwap import BandPanel, BAND_COLUMNS, band_frame
+from screener import (TOUCH_LABELS, filter_universe, filter_touches, latest_session, screen_universe,
+                      sector_summary, top_movers)
+from downsample import lod_buckets, bucket_ids, aggregate_ohlc, lttb_select
+from prewarm import PrewarmScheduler
+from resample import base_interval, resample_bars
+from instrumentation import (RerunProfile, MeteredFetcher, use_profile, current_profile, stage, add_time,
+                             count, annotate, append_log)
 
 # ページ設定
 st.set_page_config(
@@ -45,85 +60,333 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# チャート1ページに表示する銘柄数（4列×3行）と選択できる銘柄数の上限
+CHART_PAGE_SIZE = 12
+MAX_SELECTED_STOCKS = 200
+
 # セッションステート初期化
 if 'selected_stocks' not in st.session_state:
     st.session_state.selected_stocks = []
+if 'chart_page' not in st.session_state:
+    st.session_state.chart_page = 0
 
 @st.cache_data
 def load_stock_data():
     """株式データを読み込む"""
     try:
-        df = pd.read_csv('data_j.csv')
-        df = df[['コード', '銘柄名', '市場・商品区分', '33業種区分']].copy()
-        df = df.rename(columns={
-            'コード': 'code',
-            '銘柄名': 'name',
-            '市場・商品区分': 'market',
-            '33業種区分': 'sector'
-        })
-        df = df[df['market'].isin(['プライム（内国株式）', 'スタンダード（内国株式）', 'グロース（内国株式）'])]
-        df['code'] = df['code'].astype(str).str.zfill(4)
-        df['ticker'] = df['code'] + '.T'
-        return df
+        # CSVが更新されていなければ変換済みのスナップショットを読む
+        return load_universe('data_j.csv')
     except Exception as e:
         st.error(f"データファイルの読み込みエラー: {e}")
         return pd.DataFrame()
 
-def calculate_vwap_bands(df, period=20):
-    """TradingView風のVWAPバンド計算（Pine Scriptベース）"""
-    if len(df) < period:
-        return df
-    
-    # Typical Price (hlc3)
-    typical_price = (df['High'] + df['Low'] + df['Close']) / 3
-    
-    # Price * Volume
-    price_volume = typical_price * df['Volume']
-    
-    # 指定期間の移動平均を使用してVWAP計算
-    sum_pv = price_volume.rolling(window=period).sum()
-    sum_vol = df['Volume'].rolling(window=period).sum()
-    vwap_value = sum_pv / sum_vol
-    
-    # VWAP基準の偏差計算
-    deviation = typical_price - vwap_value
-    squared_dev = deviation ** 2
+@st.cache_resource
+def get_stock_info_map():
+    """ticker→銘柄情報の参照表を構築（全セッションで共有）"""
+    return build_stock_info_map(load_stock_data())
+
+@st.cache_resource
+def get_search_index():
+    """銘柄検索インデックスを構築（全セッションで共有）"""
+    return StockSearchIndex(load_stock_data())
+
+# 株価データの鮮度[秒]と、それを過ぎても取り直しの間に返す古いデータの猶予[秒]
+FETCH_TTL = 300
+FETCH_MAX_STALE = float(os.environ.get('STOCK_FETCH_MAX_STALE', '3600'))
+# 取得元への呼び出しの上限（全セッション合計で毎秒の件数と瞬間的な上限）
+FETCH_RATE = float(os.environ.get('STOCK_FETCH_RATE', '4'))
+FETCH_BURST = int(os.environ.get('STOCK_FETCH_BURST', '16'))
+# 株価データのキャッシュに使うメモリの上限[MB]（超えたら最も長く使われていない銘柄から追い出す）
+FETCH_CACHE_MB = float(os.environ.get('STOCK_CACHE_MB', '256'))
+# 分足の鮮度[秒]と、分足チャートを自動更新する間隔[秒]
+INTRADAY_TTL = float(os.environ.get('STOCK_INTRADAY_TTL', '50'))
+INTRADAY_REFRESH = float(os.environ.get('STOCK_INTRADAY_REFRESH', '60'))
+
+@st.cache_resource
+def get_rate_limiter():
+    """取得元への呼び出しのレート制限（全セッションで共有）"""
+    return TokenBucket(FETCH_RATE, FETCH_BURST)
+
+@st.cache_resource
+def get_fetch_coordinator():
+    """株価データのキャッシュと同時取得のまとめ役（全セッションで共有）"""
+    return FetchCoordinator(fresh_ttl=FETCH_TTL, max_stale=FETCH_MAX_STALE,
+                            max_bytes=int(FETCH_CACHE_MB * 1024 * 1024), sizeof=frame_nbytes)
+
+# 株価データの取得元（環境変数 STOCK_FETCHER=fake でオフラインの疑似データに切替）
+fetcher = RateLimitedFetcher(get_fetcher(), get_rate_limiter())
+
+# 取得済みのバーをディスクに保持し、再起動後も差分だけ取得する
+# （鮮度は取得キャッシュのTTLで管理するため、ストアは呼ばれるたびに差分を取得する）
+bar_store = BarStore(max_age=0)
+
+def load_stock_history(ticker, period='3mo', interval='1d'):
+    """バーストアを更新してOHLCVを返す（キャッシュ用に必要な列だけ小さい型で）"""
+    df = bar_store.refresh(ticker, period, interval, MeteredFetcher(fetcher))
+    if df is None or df.empty:
+        return None
+    return compact_ohlcv(df)
+
+def fetch_stock_history(ticker, period='3mo', interval='1d', refresh=False):
+    """株価データ（OHLCV）を取得（失敗時は例外を送出しキャッシュしない）
+
+    同じ銘柄の同時取得は全セッションで1回にまとめ、期限切れのデータは
+    裏で取り直している間そのまま返す。分足は INTRADAY_TTL 秒で期限切れにし、
+    自動更新で前回の足を見せ続けないよう期限切れのデータは返さず取り直しを待つ。
+    """
+    intraday = bool(INTERVAL_MINUTES.get(interval))
+    df, status = get_fetch_coordinator().get(
+        (ticker, period, interval), lambda: load_stock_history(ticker, period, interval), refresh=refresh,
+        fresh_ttl=INTRADAY_TTL if intraday else None, max_stale=0 if intraday else None
+    )
+    if status == 'miss':
+        count('fetch_misses')
+    elif status != 'hit':
+        count(f"fetch_{status}")
+    return df
+
+@st.cache_resource
+def get_prefetch_executor():
+    """次ページ先読み用のバックグラウンド実行器（全セッションで共有）"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+
+def prefetch_stock_data(tickers, period='3mo', interval='1d'):
+    """表示していない銘柄の株価データをバックグラウンドで取得してキャッシュを温める"""
+    if tickers:
+        get_prefetch_executor().submit(
+            fetch_many, tickers,
+            lambda ticker: fetch_stock_history(ticker, period, base_interval(interval)), retries=0
+        )
+
+def stock_history_fetcher(period='3mo', interval='1d'):
+    """取得スレッドで使う1銘柄分の取得関数（呼び出し元の再実行の計測に記録する）
+
+    取得・キャッシュは元の足種（日足または5分足）で行い、週足・月足や長い分足は
+    そこから集約する。足種を切り替えても取得し直さない。
+    """
+    profile = current_profile()
+
+    def fetch_one(ticker):
+        with use_profile(profile):
+            count('fetch_calls')
+            df = fetch_stock_history(ticker, period, base_interval(interval))
+            with stage('resample'):
+                return resample_bars(df, interval)
+    return fetch_one
+
+def get_stock_data_batch(tickers, period='3mo', interval='1d', on_progress=None):
+    """複数銘柄の株価データを並列取得（キャッシュ済みの銘柄は即時に返る）"""
+    results, errors = fetch_many(tickers, stock_history_fetcher(period, interval), on_progress=on_progress)
+    for ticker, e in errors.items():
+        st.error(f"株価データの取得エラー ({ticker}): {e}")
+    return results
+
+# タッチマーカー（記号ごとに1トレース、色は 0=±2σ 赤 / 1=±1σ 灰 の数値で指定）
+# 記号や色を文字列の配列で渡すとplotlyの要素ごとの検証が遅いため数値の色にする
+TOUCH_MARKERS = {
+    'triangle-up': [('touch_u2', 'vwap_upper_2', 0), ('touch_u1', 'vwap_upper_1', 1)],
+    'triangle-down': [('touch_l2', 'vwap_lower_2', 0), ('touch_l1', 'vwap_lower_1', 1)],
+}
+TOUCH_COLORSCALE = [[0, 'rgba(255,107,107,0.9)'], [1, 'rgba(128,128,128,0.9)']]
+
+# 描画点数の上限の既定値（1サブプロットあたり）と、間引かずに残す末尾の足数
+CHART_MAX_POINTS = 300
+CHART_FULL_RESOLUTION = 60
+
+# 日足チャートで選べる取得期間
+CHART_PERIODS = {'3mo': '90日間', '6mo': '6ヶ月', '1y': '1年', '2y': '2年', '5y': '5年'}
+
+# 週足・月足でVWAPバンド（2*period-1 本の足が必要）を描ける最短の取得期間
+BAND_MIN_PERIODS = {'1wk': '1y', '1mo': '5y'}
+
+# 選べる足種（週足・月足は日足から、15分足・60分足は5分足から集約する）
+CHART_INTERVALS = {'1d': '日足', '1wk': '週足', '1mo': '月足', '5m': '5分足', '15m': '15分足', '60m': '60分足'}
+# 分足の取得期間（yfinanceの5分足は直近60日まで）
+INTRADAY_PERIOD = '1mo'
+INTRADAY_PERIOD_LABEL = '直近1ヶ月'
+
+def x_label_format(index):
+    """X軸ラベルの書式（分足は時刻付き、1年を超える日足は年付き）"""
+    if len(index) and (index.normalize() != index).any():
+        return '%m/%d %H:%M'
+    if len(index) and index[-1] - index[0] > pd.Timedelta(days=330):
+        return '%y/%m/%d'
+    return '%m/%d'
+
+def band_trace(x_values, upper, lower, line, fillcolor):
+    """上下のバンドを1本の閉じた図形としてまとめたトレース"""
+    valid = ~(np.isnan(upper) | np.isnan(lower))
+    x_band = x_values[valid]
+    return go.Scatter(
+        x=np.concatenate([x_band, x_band[::-1]]),
+        y=np.concatenate([upper[valid], lower[valid][::-1]]),
+        mode='lines',
+        line=line,
+        fill='toself',
+        fillcolor=fillcolor,
+        showlegend=False,
+        hoverinfo='skip'
+    )
+
+def ticker_data_key(stock_data):
+    """1銘柄分のチャートの内容を決めるキー（銘柄とデータ版＝最終足）"""
+    df = stock_data['data']
+    if df is None or df.empty:
+        version = None
+    else:
+        latest = df.iloc[-1]
+        version = (len(df), df.index[0], df.index[-1], float(latest['Close']), float(latest['Volume']))
+    return (stock_data['ticker'], stock_data['name'], stock_data['code'], version)
+
+def chart_data_key(selected_stocks_data):
+    """チャートの内容を決める銘柄の並びとデータ版（最終足）のキー"""
+    return tuple(ticker_data_key(stock_data) for stock_data in selected_stocks_data[:CHART_PAGE_SIZE])
+
+@st.cache_resource(max_entries=32)
+def build_multi_chart(chart_key, _selected_stocks_data, max_points=CHART_MAX_POINTS, interval='1d'):
+    """チャートを作成してキャッシュ（データと銘柄の並びが同じなら作り直さない）"""
+    count('chart_builds')
+    return create_multi_chart(_selected_stocks_data, max_points=max_points, ticker_traces=build_ticker_traces,
+                              interval=interval)
+
+@st.cache_resource(max_entries=MAX_SELECTED_STOCKS)
+def build_ticker_traces(ticker_key, _stock_data, max_points=CHART_MAX_POINTS):
+    """1銘柄分のトレースをキャッシュ（銘柄の追加・削除やページ移動で他の銘柄を作り直さない）"""
+    return create_ticker_traces(_stock_data, max_points=max_points)
+
+def figure_points(fig):
+    """図に含まれる描画点の総数"""
+    return sum(len(trace.x) for trace in fig.data if trace.x is not None)
+
+def create_ticker_traces(stock_data, bands=None, max_points=None, full_resolution=CHART_FULL_RESOLUTION):
+    """1銘柄分のトレース（ローソク足・VWAP・バンド・タッチ）と描画する足の本数
+
+    max_points を指定すると、足数がそれを超える場合は末尾 full_resolution 本を残して
+    古い部分をローソク足はOHLC集約、VWAP・バンドはLTTBで間引いて描画する。
+    """
+    count('ticker_trace_builds')
+    df = stock_data['data']
+    if bands is None:
+        # バーストアで計算済みのバンドがあればそれを使う（週足などの集約した足では計算する）
+        bands = band_frame(df)
+    if bands is None:
+        with stage('chart.bands'):
+            bands = BandPanel.from_frames({stock_data['ticker']: df}).ticker_frame(stock_data['ticker'])
     
-    # 加重標準偏差計算
-    weighted_squared_dev = squared_dev * df['Volume']
-    sum_weighted_squared_dev = weighted_squared_dev.rolling(window=period).sum()
-    variance = sum_weighted_squared_dev / sum_vol
-    std_dev = np.sqrt(variance)
+    # 表示範囲付近は全足、古い部分はバケットに集約
+    if max_points:
+        starts = lod_buckets(len(df), max_points, full_resolution)
+    else:
+        starts = np.arange(len(df))
+    bucket = bucket_ids(len(df), starts)
+    open_, high, low, close = aggregate_ohlc(
+        df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(), df['Close'].to_numpy(), starts
+    )
+    band_values = {col: lttb_select(bands[col].to_numpy(), starts) for col in BAND_COLUMNS}
     
-    # VWAPとバンドを計算
-    df['vwap'] = vwap_value
-    df['vwap_upper_1'] = vwap_value + std_dev
-    df['vwap_lower_1'] = vwap_value - std_dev
-    df['vwap_upper_2'] = vwap_value + 2 * std_dev
-    df['vwap_lower_2'] = vwap_value - 2 * std_dev
+    # 休日を詰めるために日付を文字列に変換（銘柄ごとに1回だけ）
+    x_values = np.asarray(df.index[starts].strftime(x_label_format(df.index)))
     
-    return df
+    # ローソク足チャート
+    traces = [
+        go.Candlestick(
+            x=x_values,
+            open=open_,
+            high=high,
+            low=low,
+            close=close,
+            name=stock_data['name'],
+            decreasing={'line': {'color': '#00D4AA'}, 'fillcolor': '#00D4AA'},
+            increasing={'line': {'color': '#FF6B6B'}, 'fillcolor': '#FF6B6B'},
+            showlegend=False
+        )
+    ]
 
-@st.cache_data(ttl=300)
-def get_stock_data(ticker, period='3mo', interval='1d'):
-    """株価データを取得（90日分）"""
-    try:
-        stock = yf.Ticker(ticker)
-        df = stock.history(period=period, interval=interval)
-        if df.empty:
-            return None
-        
-        df = df.dropna()
-        df = calculate_vwap_bands(df)
-        return df
-    except Exception as e:
-        st.error(f"株価データの取得エラー ({ticker}): {e}")
-        return None
+    # VWAP
+    if not bands['vwap'].isna().all():
+        traces.append(
+            go.Scatter(
+                x=x_values,
+                y=band_values['vwap'],
+                mode='lines',
+                name=f"VWAP_{stock_data['code']}",
+                line=dict(color='#0066FF', width=2),
+                showlegend=False,
+                hoverinfo='skip'
+            )
+        )
 
-def create_multi_chart(selected_stocks_data):
-    """12銘柄のマルチチャート作成（トレーディングビュー風ドラッグ対応）"""
+    # VWAPバンド（2σ - 外側、赤色）
+    if not bands['vwap_upper_2'].isna().all():
+        traces.append(
+            band_trace(
+                x_values,
+                band_values['vwap_upper_2'],
+                band_values['vwap_lower_2'],
+                line=dict(color='rgba(255, 107, 107, 0.8)', width=1, dash='dot'),
+                fillcolor='rgba(255, 107, 107, 0.1)'
+            )
+        )
+
+    # VWAPバンド（1σ - 内側、グレー）
+    if not bands['vwap_upper_1'].isna().all():
+        traces.append(
+            band_trace(
+                x_values,
+                band_values['vwap_upper_1'],
+                band_values['vwap_lower_1'],
+                line=dict(color='rgba(128, 128, 128, 0.6)', width=1, dash='dash'),
+                fillcolor='rgba(128, 128, 128, 0.1)'
+            )
+        )
+
+    # ─── VWAPバンドタッチ（上向き・下向きごとに ±2σ 赤、±1σ 灰をまとめる） ───
+    for marker, touch_cols in TOUCH_MARKERS.items():
+        touch_x, touch_y, touch_colors = [], [], []
+        for touch_col, band_col, color in touch_cols:
+            touched = np.flatnonzero(bands[touch_col].to_numpy())
+            if not len(touched):
+                continue
+            # 集約された足のタッチは、バケットごとに1つだけその位置に表示
+            touched_buckets, first = np.unique(bucket[touched], return_index=True)
+            touch_x.append(x_values[touched_buckets])
+            touch_y.append(bands[band_col].to_numpy()[touched[first]])
+            touch_colors.append(np.full(len(touched_buckets), color))
+        if not touch_x:
+            continue
+        traces.append(
+            go.Scatter(
+                x=np.concatenate(touch_x),
+                y=np.concatenate(touch_y),
+                mode='markers',
+                marker=dict(
+                    symbol=marker, size=8, color=np.concatenate(touch_colors),
+                    colorscale=TOUCH_COLORSCALE, cmin=0, cmax=1
+                ),
+                name='touch',
+                showlegend=False,
+                hoverinfo='skip'
+            )
+        )
+
+    return traces, len(starts)
+
+def create_multi_chart(selected_stocks_data, band_panel=None, max_points=None,
+                       full_resolution=CHART_FULL_RESOLUTION, ticker_traces=None, interval='1d'):
+    """1ページ分（最大12銘柄）のマルチチャート作成（トレーディングビュー風ドラッグ対応）
+
+    銘柄ごとのトレースは create_ticker_traces で作る。ticker_traces(キー, 銘柄データ, max_points)
+    を渡すとそれで作成（キャッシュ済みのトレースの再利用など）し、band_panel を渡すと
+    全銘柄分をまとめて計算したVWAPバンドを使う。
+    """
     if not selected_stocks_data or len(selected_stocks_data) == 0:
         return None
+    page_data = selected_stocks_data[:CHART_PAGE_SIZE]
+    
+    # VWAPバンドとタッチ判定は全銘柄分をまとめて計算したものを使う
+    if band_panel is None and ticker_traces is None:
+        with stage('chart.bands'):
+            band_panel = BandPanel.from_frames({data['ticker']: data['data'] for data in page_data})
 
     # 4列×3行のサブプロット作成
     fig = make_subplots(
@@ -131,143 +394,50 @@ def create_multi_chart(selected_stocks_data):
         shared_xaxes=False,
         vertical_spacing=0.08,
         horizontal_spacing=0.05,
-        subplot_titles=[f"{data['name'][:8]}({data['code']})" for data in selected_stocks_data[:12]]
+        subplot_titles=[f"{data['name'][:8]}({data['code']})" for data in page_data]
     )
 
-    for i, stock_data in enumerate(selected_stocks_data[:12]):
+    traces, rows, cols = [], [], []
+    xaxes = {}
+    for i, stock_data in enumerate(page_data):
         if stock_data['data'] is None or stock_data['data'].empty:
             continue
         
-        df = stock_data['data']
+        if ticker_traces is not None:
+            ticker_trace_list, total_length = ticker_traces(ticker_data_key(stock_data), stock_data, max_points)
+        else:
+            bands = band_panel.ticker_frame(stock_data['ticker'])
+            ticker_trace_list, total_length = create_ticker_traces(stock_data, bands, max_points, full_resolution)
         row = (i // 4) + 1
         col = (i % 4) + 1
+        traces.extend(ticker_trace_list)
+        rows.extend([row] * len(ticker_trace_list))
+        cols.extend([col] * len(ticker_trace_list))
         
-        # 休日を詰めるために日付を文字列に変換
-        x_values = df.index.strftime('%m/%d').tolist()
-        
-        # ローソク足チャート
-        fig.add_trace(
-            go.Candlestick(
-                x=x_values,
-                open=df['Open'],
-                high=df['High'],
-                low=df['Low'],
-                close=df['Close'],
-                name=stock_data['name'],
-                decreasing={'line': {'color': '#00D4AA'}, 'fillcolor': '#00D4AA'},
-                increasing={'line': {'color': '#FF6B6B'}, 'fillcolor': '#FF6B6B'},
-                showlegend=False
-            ),
-            row=row, col=col
+        # X軸設定（トレーディングビュー風、最新20日分を初期表示）
+        start_range = max(0, total_length - 20)
+        xaxes[f"xaxis{i + 1 if i else ''}"] = dict(
+            type='category',
+            range=[start_range, total_length - 1],  # 最新20日分を表示
+            rangeslider_visible=False
         )
 
-        # VWAP
-        if 'vwap' in df.columns and not df['vwap'].isna().all():
-            fig.add_trace(
-                go.Scatter(
-                    x=x_values,
-                    y=df['vwap'],
-                    mode='lines',
-                    name=f'VWAP_{i}',
-                    line=dict(color='#0066FF', width=2),
-                    showlegend=False,
-                    hoverinfo='skip'
-                ),
-                row=row, col=col
-            )
-
-        # VWAPバンド（2σ - 外側、赤色）
-        if 'vwap_upper_2' in df.columns and not df['vwap_upper_2'].isna().all():
-            fig.add_trace(
-                go.Scatter(
-                    x=x_values,
-                    y=df['vwap_upper_2'],
-                    mode='lines',
-                    line=dict(color='rgba(255, 107, 107, 0.8)', width=1, dash='dot'),
-                    showlegend=False,
-                    hoverinfo='skip'
-                ),
-                row=row, col=col
-            )
-            
-            fig.add_trace(
-                go.Scatter(
-                    x=x_values,
-                    y=df['vwap_lower_2'],
-                    mode='lines',
-                    line=dict(color='rgba(255, 107, 107, 0.8)', width=1, dash='dot'),
-                    fill='tonexty',
-                    fillcolor='rgba(255, 107, 107, 0.1)',
-                    showlegend=False,
-                    hoverinfo='skip'
-                ),
-                row=row, col=col
-            )
-
-        # VWAPバンド（1σ - 内側、グレー）
-        if 'vwap_upper_1' in df.columns and not df['vwap_upper_1'].isna().all():
-            fig.add_trace(
-                go.Scatter(
-                    x=x_values,
-                    y=df['vwap_upper_1'],
-                    mode='lines',
-                    line=dict(color='rgba(128, 128, 128, 0.6)', width=1, dash='dash'),
-                    showlegend=False,
-                    hoverinfo='skip'
-                ),
-                row=row, col=col
-            )
-            
-            fig.add_trace(
-                go.Scatter(
-                    x=x_values,
-                    y=df['vwap_lower_1'],
-                    mode='lines',
-                    line=dict(color='rgba(128, 128, 128, 0.6)', width=1, dash='dash'),
-                    fill='tonexty',
-                    fillcolor='rgba(128, 128, 128, 0.1)',
-                    showlegend=False,
-                    hoverinfo='skip'
-                ),
-                row=row, col=col
-            )
-        # ─── VWAPバンドタッチ検出 ───
-        touch_u2 = df[(df['High'] >= df['vwap_upper_2']) & (df['Low'] <= df['vwap_upper_2'])]
-        touch_l2 = df[(df['High'] >= df['vwap_lower_2']) & (df['Low'] <= df['vwap_lower_2'])]
-        touch_u1 = df[(df['High'] >= df['vwap_upper_1']) & (df['Low'] <= df['vwap_upper_1'])]
-        touch_l1 = df[(df['High'] >= df['vwap_lower_1']) & (df['Low'] <= df['vwap_lower_1'])]
-
-        def add_touch_mark(df_touch, y_col, marker, color):
-            if df_touch.empty:
-                return
-            fig.add_trace(
-                go.Scatter(
-                    x=df_touch.index.strftime('%m/%d'),
-                    y=df_touch[y_col],
-                    mode='markers',
-                    marker_symbol=marker,
-                    marker_size=8,
-                    marker_color=color,
-                    name='touch',
-                    showlegend=False,
-                    hoverinfo='skip'
-                ),
-                row=row, col=col
-            )
-
-        # ±2σタッチ（赤）
-        add_touch_mark(touch_u2, 'vwap_upper_2', 'triangle-up', 'rgba(255,107,107,0.9)')
-        add_touch_mark(touch_l2, 'vwap_lower_2', 'triangle-down', 'rgba(255,107,107,0.9)')
-
-        # ±1σタッチ（灰）
-        add_touch_mark(touch_u1, 'vwap_upper_1', 'triangle-up', 'rgba(128,128,128,0.9)')
-        add_touch_mark(touch_l1, 'vwap_lower_1', 'triangle-down', 'rgba(128,128,128,0.9)')
-
+    # トレースと軸の設定はまとめて追加する（1つずつだと検証が銘柄数ぶん繰り返される）
+    if traces:
+        fig.add_traces(traces, rows=rows, cols=cols)
+    fig.update_layout(xaxes)
+    fig.update_xaxes(
+        showgrid=True,
+        gridwidth=0.3,
+        gridcolor='rgba(128,128,128,0.2)',
+        tickangle=45,
+        tickfont=dict(size=8)
+    )
 
     # レイアウト更新（トレーディングビュー風）
     fig.update_layout(
         title=dict(
-            text=f"<b>📈 日本株マルチチャート - 日足 (ドラッグで期間変更)</b>",
+            text=f"<b>📈 日本株マルチチャート - {CHART_INTERVALS[interval]} (ドラッグで期間変更)</b>",
             font=dict(size=20, color='#2C3E50'),
             x=0.5
         ),
@@ -281,31 +451,6 @@ def create_multi_chart(selected_stocks_data):
         showlegend=False
     )
 
-    # 各サブプロットのX軸設定（トレーディングビュー風）
-    for i in range(1, 13):
-        row = ((i-1) // 4) + 1
-        col = ((i-1) % 4) + 1
-        
-        # 最新20日分を初期表示に設定
-        if selected_stocks_data and len(selected_stocks_data) > i-1 and selected_stocks_data[i-1]['data'] is not None:
-            df = selected_stocks_data[i-1]['data']
-            if not df.empty:
-                total_length = len(df)
-                start_range = max(0, total_length - 20)  # 最新20日分
-                x_values = df.index.strftime('%m/%d').tolist()
-                
-                fig.update_xaxes(
-                    type='category',
-                    range=[start_range, total_length - 1],  # 最新20日分を表示
-                    showgrid=True,
-                    gridwidth=0.3,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    tickangle=45,
-                    tickfont=dict(size=8),
-                    rangeslider_visible=False,
-                    row=row, col=col
-                )
-
     # Y軸の設定
     fig.update_yaxes(
         showgrid=True,
@@ -316,6 +461,94 @@ def create_multi_chart(selected_stocks_data):
 
     return fig
 
+# タイル表示で全銘柄の取得を待つ上限[秒]（過ぎた銘柄は時間切れとして表示）
+CHART_DEADLINE = 20
+
+@st.cache_resource(max_entries=MAX_SELECTED_STOCKS)
+def build_tile_chart(ticker_key, _stock_data, max_points=CHART_MAX_POINTS):
+    """1銘柄分のタイル用チャートをキャッシュ（トレースは build_ticker_traces を共有）"""
+    traces, total_length = build_ticker_traces(ticker_key, _stock_data, max_points)
+    return create_tile_chart(_stock_data, traces, total_length)
+
+def create_tile_chart(stock_data, traces, total_length):
+    """1銘柄分のチャート（タイル表示用、マルチチャートの1マスと同じ見た目）"""
+    fig = go.Figure(data=traces)
+    axis_style = dict(showgrid=True, gridwidth=0.3, gridcolor='rgba(128,128,128,0.2)', tickfont=dict(size=8))
+    fig.update_layout(
+        title=dict(text=f"{stock_data['name'][:8]}({stock_data['code']})", font=dict(size=13), x=0.5),
+        height=300,
+        template="plotly_white",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='white',
+        font=dict(size=10, family="Arial, sans-serif"),
+        margin=dict(l=10, r=10, t=40, b=10),
+        dragmode='pan',
+        showlegend=False,
+        # 最新20日分を初期表示
+        xaxis=dict(type='category', range=[max(0, total_length - 20), total_length - 1],
+                   rangeslider_visible=False, tickangle=45, **axis_style),
+        yaxis=axis_style
+    )
+    return fig
+
+def latest_price_metric(stock_data):
+    """銘柄の最新価格と前日比"""
+    label = f"{stock_data['code']} {stock_data['name'][:8]}"
+    if stock_data['data'] is None or stock_data['data'].empty:
+        st.metric(label=label, value="データなし", delta=None)
+        return
+    latest = stock_data['data'].iloc[-1]
+    prev_close = stock_data['data'].iloc[-2]['Close'] if len(stock_data['data']) > 1 else latest['Close']
+    change = latest['Close'] - prev_close
+    change_pct = (change / prev_close) * 100 if prev_close != 0 else 0
+    st.metric(label=label, value=f"¥{latest['Close']:,.0f}", delta=f"{change_pct:+.2f}%")
+
+def render_chart_tiles(page_infos, chart_period, max_points, interval='1d'):
+    """銘柄ごとのチャートと最新価格を、データが届いた順にタイルに表示
+
+    全銘柄の取得を同時に始め、届いた銘柄から描画する。遅い銘柄は読み込み中の表示のまま
+    待ち、CHART_DEADLINE 秒を過ぎた銘柄と失敗した銘柄はその旨を表示する。
+    """
+    placeholders = {}
+    for row_start in range(0, len(page_infos), 4):
+        cols = st.columns(4)
+        for col, stock_info in zip(cols, page_infos[row_start:row_start + 4]):
+            with col:
+                placeholders[stock_info.ticker] = st.empty()
+                placeholders[stock_info.ticker].info(f"⏳ {stock_info.code} {stock_info.name[:8]} 読み込み中...")
+    infos = {stock_info.ticker: stock_info for stock_info in page_infos}
+    fetch_one = stock_history_fetcher(chart_period, interval)
+    failed = []
+
+    async def render_as_completed():
+        started = time.perf_counter()
+        first_tile = True
+        async for ticker, df, error in fetch_as_completed(list(infos), fetch_one, timeout=CHART_DEADLINE):
+            stock_info = infos[ticker]
+            if error is not None:
+                failed.append(ticker)
+                icon = "⌛" if isinstance(error, TimeoutError) else "⚠️"
+                placeholders[ticker].warning(f"{icon} {stock_info.code} {stock_info.name[:8]}: {error}")
+                continue
+            stock_data = {'ticker': ticker, 'name': stock_info.name, 'code': stock_info.code, 'data': df}
+            with placeholders[ticker].container():
+                if df is not None and not df.empty:
+                    fig = build_tile_chart(ticker_data_key(stock_data), stock_data, max_points)
+                    count('figure_traces', len(fig.data))
+                    count('figure_points', figure_points(fig))
+                    st.plotly_chart(fig, use_container_width=True, key=f"tile_{ticker}")
+                latest_price_metric(stock_data)
+            if first_tile:
+                # 最初の1銘柄を表示するまでの時間
+                add_time('tiles.first', time.perf_counter() - started)
+                first_tile = False
+
+    with stage('tiles'):
+        asyncio.run(render_as_completed())
+    if failed:
+        # 取得は裏で続いているので、少し待って再表示すれば揃うことが多い
+        st.button("🔄 取得できなかった銘柄を再読み込み")
+
 def save_watchlist(name, tickers):
     """ウォッチリストを保存"""
     if not os.path.exists('watchlists'):
@@ -338,177 +571,551 @@ def get_watchlist_names():
     files = [f[:-5] for f in os.listdir('watchlists') if f.endswith('.json')]
     return files
 
+def get_watchlist_tickers():
+    """保存済みの全ウォッチリストの銘柄（重複なし）"""
+    tickers = []
+    for name in get_watchlist_names():
+        tickers.extend(load_watchlist(name)[:MAX_SELECTED_STOCKS])
+    return list(dict.fromkeys(tickers))
+
+# ウォッチリストの事前取得（環境変数 STOCK_PREWARM=1 で有効）
+PREWARM_ENABLED = os.environ.get('STOCK_PREWARM') == '1'
+# 取得し直す間隔[秒]（取得キャッシュのTTL 300秒より短くしてキャッシュ切れを防ぐ）
+PREWARM_INTERVAL = float(os.environ.get('STOCK_PREWARM_INTERVAL', '240'))
+PREWARM_WORKERS = int(os.environ.get('STOCK_PREWARM_WORKERS', '4'))
+PREWARM_RATE = float(os.environ.get('STOCK_PREWARM_RATE', '2'))
+# この秒数以内にどれかのセッションで表示された期間・足種も事前取得する
+PREWARM_VIEW_TTL = float(os.environ.get('STOCK_PREWARM_VIEW_TTL', '86400'))
+
+@st.cache_resource
+def get_prewarm_views():
+    """表示された (期間, 取得する足種) → 最後に表示した時刻（全セッションで共有）"""
+    return {}
+
+def record_prewarm_view(period, interval):
+    """チャートで表示した期間・足種を事前取得の対象に加える（新しい組み合わせならすぐ取得する）"""
+    views = get_prewarm_views()
+    view = (period, base_interval(interval))
+    is_new = view not in views
+    views[view] = time.monotonic()
+    if is_new:
+        get_prewarm_scheduler().wake()
+
+def get_prewarm_keys():
+    """事前取得する (銘柄, 期間, 足種)（既定の日足と、最近表示された期間・足種の組み合わせ）"""
+    now = time.monotonic()
+    views = [view for view, shown in list(get_prewarm_views().items()) if now - shown < PREWARM_VIEW_TTL]
+    views = list(dict.fromkeys([(next(iter(CHART_PERIODS)), '1d')] + views))
+    return [(ticker, period, interval) for period, interval in views for ticker in get_watchlist_tickers()]
+
+@st.cache_resource
+def get_prewarm_scheduler():
+    """ウォッチリストの全銘柄を、既定の日足と最近表示された期間・足種で定期的に取得し直す（プロセスで1つ）"""
+    scheduler = PrewarmScheduler(
+        lambda key: fetch_stock_history(*key, refresh=True),
+        get_prewarm_keys,
+        interval=PREWARM_INTERVAL,
+        max_workers=PREWARM_WORKERS,
+        rate=PREWARM_RATE
+    ).start()
+    # プロセス終了時に止める（cache_resource の on_release は requirements の最低版にない）
+    atexit.register(scheduler.stop)
+    return scheduler
+
+def prewarm_status(scheduler):
+    """事前取得の状況の表示文"""
+    last_run = scheduler.last_run
+    if last_run is None:
+        return "🔄 ウォッチリストを事前取得中..."
+    views = len(get_prewarm_views()) or 1
+    text = (f"🔄 事前取得 {last_run['finished']:%H:%M} ・ {last_run['tickers']}件（{last_run['seconds']:.0f}秒）"
+            f" ・ 対象 {views}通りの期間・足種")
+    if last_run['errors']:
+        text += f" ・ 失敗 {last_run['errors']}"
+    if scheduler.next_run is not None:
+        text += f" ・ 次回 {scheduler.next_run:%H:%M}"
+    return text
+
+# スクリーナーで読み込む足の本数（最新足のバンド計算に必要な本数 + 前日比）
+SCREENER_BARS = 60
+
+def load_screener_bars(ticker, refresh=False):
+    """スクリーナー用に保存済みのバーを読む（未保存、または refresh 指定時は取得）"""
+    df = None if refresh else bar_store.read_recent(ticker, '1d', SCREENER_BARS)
+    if df is None:
+        df = bar_store.refresh(ticker, '3mo', '1d', fetcher)
+    return df
+
+def add_screened_stocks():
+    """スクリーナーの表で選択した銘柄をチャートに追加"""
+    results = st.session_state.get('screener_results')
+    selection = st.session_state.screener_table.selection
+    for row in selection.rows:
+        ticker = results.iloc[row]['ticker']
+        if ticker in st.session_state.selected_stocks:
+            continue
+        if len(st.session_state.selected_stocks) >= MAX_SELECTED_STOCKS:
+            st.session_state.screener_notice = f"最大{MAX_SELECTED_STOCKS}銘柄まで選択可能です"
+            break
+        st.session_state.selected_stocks.append(ticker)
+
+def render_screener(stock_df):
+    """全銘柄のVWAPバンドタッチ スクリーナー"""
+    st.subheader("🔎 VWAPバンドタッチ スクリーナー（最新足）")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        markets = st.multiselect("市場", sorted(stock_df['market'].unique()))
+    with col2:
+        sectors = st.multiselect("業種", sorted(s for s in stock_df['sector'].unique() if s != '-'))
+    with col3:
+        touch_labels = st.multiselect("タッチ条件", list(TOUCH_LABELS), default=['+2σ', '-2σ'])
+    stored_only = st.checkbox("保存済みのデータだけでスキャンする（未保存の銘柄は取得しない）")
+    refresh = st.checkbox("保存済みデータも最新に更新する（時間がかかります）", disabled=stored_only)
+    refresh = refresh and not stored_only
+    
+    universe = filter_universe(stock_df, markets, sectors)
+    if universe.empty:
+        st.warning("条件に該当する銘柄がありません。市場・業種の組み合わせを変えてください")
+    elif not stored_only:
+        # 取得元への呼び出しは全セッション合計で毎秒 FETCH_RATE 件までのため、未保存の銘柄が多いと遅い
+        to_fetch = len(universe) if refresh else sum(not bar_store.has(ticker, '1d') for ticker in universe['ticker'])
+        if to_fetch:
+            st.warning(
+                f"⏱ {to_fetch}銘柄は取得元から取得するため約{max(1, round(to_fetch / FETCH_RATE / 60))}分かかります"
+                f"（毎秒{FETCH_RATE:g}件まで）。保存済みのデータだけでもスキャンできます"
+            )
+    
+    if st.button("▶️ スキャン実行", disabled=universe.empty):
+        if stored_only:
+            load_bars = lambda ticker: bar_store.read_recent(ticker, '1d', SCREENER_BARS)
+        else:
+            load_bars = lambda ticker: load_screener_bars(ticker, refresh)
+        touches = [TOUCH_LABELS[label] for label in touch_labels]
+        progress_bar = st.progress(0)
+        results, timings, errors = screen_universe(
+            universe,
+            load_bars,
+            # 保存済みだけのときは日付をそろえてからタッチで絞る
+            touches=None if stored_only else touches,
+            on_progress=lambda done, total: progress_bar.progress(done / total)
+        )
+        progress_bar.empty()
+        session_note = ""
+        if stored_only and not results.empty:
+            # 保存済みの最終足は銘柄ごとに日付が違うため、業種サマリーと同じく最も多い日付の足だけ判定する
+            results, stale = latest_session(results)
+            session_note = f" ・ {results['date'].max():%Y-%m-%d} の足で判定"
+            if stale:
+                session_note += f"（最新足がこの日でない {stale}銘柄は除外）"
+            results = filter_touches(results, touches)
+        for name, seconds in timings.items():
+            add_time(f"screener.{name}", seconds)
+        count('screener_tickers', len(universe))
+        st.session_state.screener_results = results
+        st.session_state.screener_summary = (
+            f"対象 {len(universe)}銘柄 / 該当 {len(results)}銘柄 ・ "
+            f"読み込み {timings['load']:.1f}秒 ・ バンド計算 {timings['bands']:.2f}秒 ・ "
+            f"集計 {timings['results']:.2f}秒{session_note}"
+        )
+        if errors:
+            st.warning(f"{len(errors)}銘柄のデータを取得できませんでした")
+    
+    results = st.session_state.get('screener_results')
+    if results is None:
+        st.info("条件を選んで「スキャン実行」を押してください")
+        return
+    
+    st.caption(st.session_state.screener_summary)
+    if st.session_state.get('screener_notice'):
+        st.warning(st.session_state.pop('screener_notice'))
+    st.write("行を選択するとチャートに追加されます（列見出しクリックで並べ替え）")
+    display = results[['code', 'name', 'market', 'sector', 'date', 'close', 'change_pct', 'sigma',
+                       'touch_u2', 'touch_l2', 'touch_u1', 'touch_l1']]
+    st.dataframe(
+        display,
+        key='screener_table',
+        on_select=add_screened_stocks,
+        selection_mode='multi-row',
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'code': 'コード',
+            'name': '銘柄名',
+            'market': '市場',
+            'sector': '業種',
+            'date': st.column_config.DateColumn('日付', format="YYYY-MM-DD"),
+            'close': st.column_config.NumberColumn('終値', format="¥%.0f"),
+            'change_pct': st.column_config.NumberColumn('前日比', format="%+.2f%%"),
+            'sigma': st.column_config.NumberColumn('VWAP乖離(σ)', format="%+.2f"),
+            'touch_u2': '+2σ',
+            'touch_l2': '-2σ',
+            'touch_u1': '+1σ',
+            'touch_l1': '-1σ',
+        }
+    )
+
+@st.cache_data(ttl=FETCH_TTL, show_spinner="全銘柄の保存済みデータを集計中...")
+def scan_stored_universe():
+    """保存済みのバーだけで全銘柄の最新足をスキャン（業種ダッシュボード用、取得はしない）"""
+    results, timings, _ = screen_universe(
+        load_stock_data(),
+        lambda ticker: bar_store.read_recent(ticker, '1d', SCREENER_BARS)
+    )
+    return results, timings
+
+def show_sector_movers(tickers):
+    """業種の値動き上位銘柄でチャートを置き換えてマルチチャートに切り替える"""
+    st.session_state.selected_stocks = list(tickers)
+    st.session_state.chart_page = 0
+    st.session_state.view_mode = "📊 マルチチャート"
+
+def render_sector_dashboard(stock_df):
+    """業種ごとのVWAP上の割合・±2σタッチの割合・前日比の中央値と、業種の値動き上位銘柄"""
+    st.subheader("🏭 業種別サマリー（最新足）")
+    
+    if st.button("🔄 再集計"):
+        scan_stored_universe.clear()
+    results, timings = scan_stored_universe()
+    for name, seconds in timings.items():
+        add_time(f"sectors.{name}", seconds)
+    count('sector_tickers', len(results))
+    if results.empty:
+        st.info("保存済みのデータがありません。スクリーナーでスキャンすると集計できるようになります")
+        return
+    
+    results, stale = latest_session(results)
+    summary = sector_summary(results)
+    st.caption(
+        f"保存済みデータのある {len(results) + stale} / {len(stock_df)}銘柄 ・ "
+        f"{results['date'].max():%Y-%m-%d} の足で集計"
+        + (f"（最新足がこの日でない {stale}銘柄は除外）" if stale else "")
+        + f" ・ 読み込み {timings['load']:.1f}秒 ・ バンド計算 {timings['bands']:.2f}秒"
+    )
+    st.write("業種を選ぶと値動きの大きい銘柄を表示します（列見出しクリックで並べ替え）")
+    event = st.dataframe(
+        summary,
+        key='sector_table',
+        on_select='rerun',
+        selection_mode='single-row',
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'sector': '業種',
+            'members': '銘柄数',
+            'above_vwap_pct': st.column_config.NumberColumn('VWAP上', format="%.0f%%"),
+            'touch_2s_pct': st.column_config.NumberColumn('±2σタッチ', format="%.0f%%"),
+            'median_change_pct': st.column_config.NumberColumn('前日比（中央値）', format="%+.2f%%"),
+        }
+    )
+    if not event.selection.rows:
+        return
+    
+    sector = summary.iloc[event.selection.rows[0]]['sector']
+    movers = top_movers(results, sector, CHART_PAGE_SIZE)
+    st.markdown(f"**{sector}** の値動き上位{len(movers)}銘柄")
+    st.dataframe(
+        movers[['code', 'name', 'market', 'close', 'change_pct', 'sigma']],
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'code': 'コード',
+            'name': '銘柄名',
+            'market': '市場',
+            'close': st.column_config.NumberColumn('終値', format="¥%.0f"),
+            'change_pct': st.column_config.NumberColumn('前日比', format="%+.2f%%"),
+            'sigma': st.column_config.NumberColumn('VWAP乖離(σ)', format="%+.2f"),
+        }
+    )
+    st.button("📊 この銘柄でチャートを表示", on_click=show_sector_movers, args=(movers['ticker'],),
+              help="選択中の銘柄を置き換えます")
+
+def move_chart_page(step):
+    """チャートのページを前後に移動"""
+    st.session_state.chart_page += step
+
+def render_page_selector(tickers):
+    """ページ切り替えを表示し、表示するページの銘柄を返す"""
+    page_count = max(math.ceil(len(tickers) / CHART_PAGE_SIZE), 1)
+    # 銘柄を削除してページ数が減った場合に備える
+    st.session_state.chart_page = min(max(st.session_state.chart_page, 0), page_count - 1)
+    
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 4, 1])
+        with col1:
+            st.button("◀ 前へ", on_click=move_chart_page, args=(-1,),
+                      disabled=st.session_state.chart_page == 0)
+        with col2:
+            st.selectbox(
+                "ページ",
+                range(page_count),
+                key='chart_page',
+                format_func=lambda page: (
+                    f"{page + 1} / {page_count} ページ"
+                    f"（{page * CHART_PAGE_SIZE + 1}〜{min((page + 1) * CHART_PAGE_SIZE, len(tickers))}銘柄目）"
+                ),
+                label_visibility='collapsed'
+            )
+        with col3:
+            st.button("次へ ▶", on_click=move_chart_page, args=(1,),
+                      disabled=st.session_state.chart_page == page_count - 1)
+    
+    start = st.session_state.chart_page * CHART_PAGE_SIZE
+    return tickers[start:start + CHART_PAGE_SIZE]
+
+@st.fragment
+def render_stock_picker(stock_df, stock_info_map, prewarm_scheduler=None):
+    """サイドバーの銘柄選択・検索・ウォッチリスト（検索入力などはこの部分だけ再実行）
+
+    選択中の銘柄が変わったときだけ st.rerun() でページ全体を再実行する。
+    """
+    # 選択済み銘柄表示
+    st.subheader("📋 選択中の銘柄")
+    if st.session_state.selected_stocks:
+        for i, ticker in enumerate(st.session_state.selected_stocks):
+            stock_info = stock_info_map.get(ticker)
+            if stock_info is not None:
+                name = stock_info.name
+                code = stock_info.code
+
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    st.markdown(f'<div class="selected-stock">{code} {name[:12]}</div>', 
+                              unsafe_allow_html=True)
+                with col2:
+                    if st.button("❌", key=f"remove_{i}"):
+                        st.session_state.selected_stocks.remove(ticker)
+                        st.rerun()
+    else:
+        st.info("銘柄を選択してください")
+
+    if st.button("🗑️ 全て削除"):
+        st.session_state.selected_stocks = []
+        st.rerun()
+
+    # 銘柄検索エリア
+    st.subheader("🔍 銘柄検索・追加")
+    search_term = st.text_input("銘柄検索", placeholder="銘柄名・コード・業種を入力")
+    search_index = get_search_index()
+    with st.expander("市場・業種で絞り込み"):
+        search_market = st.selectbox("市場", [""] + search_index.market_names)
+        search_sector = st.selectbox("業種", [""] + search_index.sector_names)
+
+    # 検索結果表示
+    if search_term or search_market or search_sector:
+        filtered_df = stock_df.iloc[search_index.search(
+            search_term, limit=20, market=search_market, sector=search_sector
+        )]
+
+        st.write("**検索結果:**")
+        for _, row in filtered_df.iterrows():
+            if len(st.session_state.selected_stocks) >= MAX_SELECTED_STOCKS:
+                st.warning(f"最大{MAX_SELECTED_STOCKS}銘柄まで選択可能です")
+                break
+
+            if row['ticker'] not in st.session_state.selected_stocks:
+                if st.button(f"➕ {row['code']} {row['name'][:20]}", key=f"add_{row['ticker']}"):
+                    st.session_state.selected_stocks.append(row['ticker'])
+                    st.rerun()
+            else:
+                st.write(f"✅ {row['code']} {row['name'][:20]} (選択済み)")
+
+    # ウォッチリスト管理
+    st.subheader("⭐ ウォッチリスト")
+
+    if prewarm_scheduler is not None:
+        st.caption(prewarm_status(prewarm_scheduler))
+
+    # 既存のウォッチリスト
+    watchlist_names = get_watchlist_names()
+    if watchlist_names:
+        selected_watchlist = st.selectbox(
+            "ウォッチリスト選択",
+            [""] + watchlist_names
+        )
+
+        if selected_watchlist:
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("📥 読み込み"):
+                    watchlist_tickers = load_watchlist(selected_watchlist)
+                    st.session_state.selected_stocks = watchlist_tickers[:MAX_SELECTED_STOCKS]
+                    st.success(f"'{selected_watchlist}'を読み込みました")
+                    st.rerun()
+
+            with col2:
+                if st.button("💾 上書き保存"):
+                    save_watchlist(selected_watchlist, st.session_state.selected_stocks)
+                    if prewarm_scheduler is not None:
+                        prewarm_scheduler.wake()
+                    st.success(f"'{selected_watchlist}'を更新しました")
+
+    # 新規ウォッチリスト作成
+    with st.expander("新しいリスト作成"):
+        new_watchlist_name = st.text_input("新しいリスト名")
+        if st.button("💾 現在の選択で作成"):
+            if new_watchlist_name and st.session_state.selected_stocks:
+                save_watchlist(new_watchlist_name, st.session_state.selected_stocks)
+                if prewarm_scheduler is not None:
+                    prewarm_scheduler.wake()
+                st.success(f"'{new_watchlist_name}'を作成しました")
+                # 選択は変わらないのでリスト一覧だけ更新する
+                st.rerun(scope='fragment')
+            else:
+                st.error("リスト名と銘柄選択が必要です")
+
+def chart_area(stock_info_map, chart_period, max_points, tile_mode=True, interval='1d'):
+    """選択中の銘柄のマルチチャートと最新価格
+
+    tile_mode なら銘柄ごとのタイルに届いた順に表示し、そうでなければ全銘柄が揃ってから
+    1枚の図にまとめて表示する。
+    """
+    if current_profile() is None:
+        # ページ切り替えや自動更新でこの部分だけ再実行されたときも、1回の再実行として計測してログに残す
+        profile = RerunProfile(session=st.session_state.get('session_id'), fragment='chart',
+                               period=chart_period, interval=interval)
+        try:
+            with use_profile(profile):
+                chart_area(stock_info_map, chart_period, max_points, tile_mode, interval)
+        finally:
+            append_log(profile.record())
+        return
+
+    period_label = CHART_PERIODS.get(chart_period, INTRADAY_PERIOD_LABEL)
+    st.subheader(f"📊 マルチチャート - {CHART_INTERVALS[interval]}（{period_label}データ）")
+
+    # 操作ガイド
+    st.info("💡 **操作方法:** チャートをドラッグして期間移動、マウスホイールで拡大縮小、ダブルクリックでズームリセット")
+
+    # ページ切り替え（表示中のページの銘柄だけ取得・描画する）
+    page_tickers = render_page_selector(st.session_state.selected_stocks)
+    if PREWARM_ENABLED:
+        record_prewarm_view(chart_period, interval)
+    annotate(page=st.session_state.chart_page, page_tickers=len(page_tickers), tiles=tile_mode)
+
+    # 次のページはバックグラウンドで先読み
+    next_start = (st.session_state.chart_page + 1) * CHART_PAGE_SIZE
+    prefetch_stock_data(
+        st.session_state.selected_stocks[next_start:next_start + CHART_PAGE_SIZE], chart_period, interval
+    )
+
+    if tile_mode:
+        render_chart_tiles(lookup_stock_info(stock_info_map, page_tickers), chart_period, max_points, interval)
+        return
+
+    with st.spinner("チャートを読み込み中..."):
+        # 表示ページの銘柄のデータを並列取得
+        progress_bar = st.progress(0)
+        with stage('fetch'):
+            stock_data_map = get_stock_data_batch(
+                page_tickers, chart_period, interval,
+                on_progress=lambda done, total: progress_bar.progress(done / total)
+            )
+
+        selected_stocks_data = []
+        for stock_info in lookup_stock_info(stock_info_map, page_tickers):
+            selected_stocks_data.append({
+                'ticker': stock_info.ticker,
+                'name': stock_info.name,
+                'code': stock_info.code,
+                'data': stock_data_map.get(stock_info.ticker)
+            })
+
+        progress_bar.empty()
+
+        # マルチチャート作成（同じデータ・並びならキャッシュ済みの図を再利用）
+        with stage('chart'):
+            multi_chart = build_multi_chart(chart_data_key(selected_stocks_data), selected_stocks_data, max_points, interval)
+
+        if multi_chart:
+            count('figure_traces', len(multi_chart.data))
+            count('figure_points', figure_points(multi_chart))
+            # 図のシリアライズとブラウザへの送信
+            with stage('render'):
+                st.plotly_chart(multi_chart, use_container_width=True)
+
+            # 銘柄別最新価格
+            st.subheader("💰 銘柄別最新価格")
+
+            cols = st.columns(4)
+            for i, stock_data in enumerate(selected_stocks_data):
+                with cols[i % 4]:
+                    latest_price_metric(stock_data)
+        else:
+            st.error("チャートの作成に失敗しました")
+
+# ページ切り替えはチャート部分だけ再実行する。分足の自動更新中は INTRADAY_REFRESH 秒ごとにも
+# 再実行し、バーストアが新しい足だけ取得してバンドも新しい足の分だけ更新する
+render_chart_area = st.fragment(chart_area)
+render_live_chart_area = st.fragment(chart_area, run_every=INTRADAY_REFRESH)
+
 def main():
     # ヘッダー
     st.markdown("""
     <div class="main-header">
         <h1>📈 日本株マルチチャート</h1>
-        <p>最大12銘柄同時表示 - ドラッグで期間変更可能</p>
+        <p>1ページ12銘柄表示（最大200銘柄） - ドラッグで期間変更可能</p>
     </div>
     """, unsafe_allow_html=True)
     
     # データ読み込み
-    stock_df = load_stock_data()
+    with stage('universe'):
+        stock_df = load_stock_data()
     
     if stock_df.empty:
         st.error("株式データの読み込みに失敗しました。")
         return
+    with stage('universe'):
+        stock_info_map = get_stock_info_map()
+    prewarm_scheduler = get_prewarm_scheduler() if PREWARM_ENABLED else None
     
     # サイドバー
-    with st.sidebar:
+    with st.sidebar, stage('sidebar'):
         st.header("⚙️ 設定")
-        
-        # 選択済み銘柄表示
-        st.subheader("📋 選択中の銘柄")
-        if st.session_state.selected_stocks:
-            for i, ticker in enumerate(st.session_state.selected_stocks):
-                stock_info = stock_df[stock_df['ticker'] == ticker]
-                if not stock_info.empty:
-                    name = stock_info.iloc[0]['name']
-                    code = stock_info.iloc[0]['code']
-                    
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.markdown(f'<div class="selected-stock">{code} {name[:12]}</div>', 
-                                  unsafe_allow_html=True)
-                    with col2:
-                        if st.button("❌", key=f"remove_{i}"):
-                            st.session_state.selected_stocks.remove(ticker)
-                            st.rerun()
-        else:
-            st.info("銘柄を選択してください")
-        
-        if st.button("🗑️ 全て削除"):
-            st.session_state.selected_stocks = []
-            st.rerun()
-        
-        # 銘柄検索エリア
-        st.subheader("🔍 銘柄検索・追加")
-        search_term = st.text_input("銘柄検索", placeholder="銘柄名またはコードを入力")
-        
-        # 検索結果表示
-        if search_term:
-            filtered_df = stock_df[
-                (stock_df['name'].str.contains(search_term, na=False, case=False)) |
-                (stock_df['code'].str.contains(search_term, na=False, case=False))
-            ].head(20)
-            
-            st.write("**検索結果:**")
-            for _, row in filtered_df.iterrows():
-                if len(st.session_state.selected_stocks) >= 12:
-                    st.warning("最大12銘柄まで選択可能です")
-                    break
-                
-                if row['ticker'] not in st.session_state.selected_stocks:
-                    if st.button(f"➕ {row['code']} {row['name'][:20]}", key=f"add_{row['ticker']}"):
-                        st.session_state.selected_stocks.append(row['ticker'])
-                        st.rerun()
-                else:
-                    st.write(f"✅ {row['code']} {row['name'][:20]} (選択済み)")
-        
-        # ウォッチリスト管理
-        st.subheader("⭐ ウォッチリスト")
-        
-        # 既存のウォッチリスト
-        watchlist_names = get_watchlist_names()
-        if watchlist_names:
-            selected_watchlist = st.selectbox(
-                "ウォッチリスト選択",
-                [""] + watchlist_names
+        view_mode = st.radio("表示モード", ["📊 マルチチャート", "🔎 スクリーナー", "🏭 業種"],
+                             horizontal=True, key='view_mode')
+        chart_interval = st.selectbox("足種", list(CHART_INTERVALS), format_func=CHART_INTERVALS.get,
+                                      help="週足・月足・15分足・60分足は取得済みの日足・5分足から作るため、切り替えても取得し直しません")
+        intraday = base_interval(chart_interval) != '1d'
+        chart_period = st.selectbox(
+            "表示期間（日足・週足・月足）", list(CHART_PERIODS), format_func=CHART_PERIODS.get, disabled=intraday,
+            help=f"分足は{INTRADAY_PERIOD_LABEL}分を表示します"
+        )
+        if intraday:
+            chart_period = INTRADAY_PERIOD
+        min_period = BAND_MIN_PERIODS.get(chart_interval)
+        if min_period and list(CHART_PERIODS).index(chart_period) < list(CHART_PERIODS).index(min_period):
+            st.caption(f"{CHART_INTERVALS[chart_interval]}のVWAPバンドを描くため{CHART_PERIODS[min_period]}分を取得します")
+            chart_period = min_period
+        live = intraday and st.checkbox(f"{INTRADAY_REFRESH:.0f}秒ごとに自動更新", value=True)
+        with st.expander("チャート詳細設定"):
+            max_points = st.slider(
+                "1チャートあたりの最大描画本数", 100, 2000, CHART_MAX_POINTS, step=50,
+                help=f"超えた分は最新{CHART_FULL_RESOLUTION}本を残して古い足を集約して描画します"
+            )
+            tile_mode = st.checkbox(
+                "銘柄ごとに届いた順に表示", value=True,
+                help="オフにすると全銘柄の取得を待って1枚の図にまとめて表示します"
             )
-            
-            if selected_watchlist:
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("📥 読み込み"):
-                        watchlist_tickers = load_watchlist(selected_watchlist)
-                        st.session_state.selected_stocks = watchlist_tickers[:12]
-                        st.success(f"'{selected_watchlist}'を読み込みました")
-                        st.rerun()
-                
-                with col2:
-                    if st.button("💾 上書き保存"):
-                        save_watchlist(selected_watchlist, st.session_state.selected_stocks)
-                        st.success(f"'{selected_watchlist}'を更新しました")
         
-        # 新規ウォッチリスト作成
-        with st.expander("新しいリスト作成"):
-            new_watchlist_name = st.text_input("新しいリスト名")
-            if st.button("💾 現在の選択で作成"):
-                if new_watchlist_name and st.session_state.selected_stocks:
-                    save_watchlist(new_watchlist_name, st.session_state.selected_stocks)
-                    st.success(f"'{new_watchlist_name}'を作成しました")
-                    st.rerun()
-                else:
-                    st.error("リスト名と銘柄選択が必要です")
+        # 銘柄の選択・検索・ウォッチリスト（操作しても選択が変わらない限りチャートは再実行しない）
+        render_stock_picker(stock_df, stock_info_map, prewarm_scheduler)
     
     # メインエリア
-    if st.session_state.selected_stocks:
-        st.subheader("📊 マルチチャート - 日足（90日間データ）")
-        
-        # 操作ガイド
-        st.info("💡 **操作方法:** チャートをドラッグして期間移動、マウスホイールで拡大縮小、ダブルクリックでズームリセット")
-        
-        with st.spinner("チャートを読み込み中..."):
-            # 各銘柄のデータを取得
-            selected_stocks_data = []
-            progress_bar = st.progress(0)
-            
-            for i, ticker in enumerate(st.session_state.selected_stocks):
-                stock_info = stock_df[stock_df['ticker'] == ticker]
-                if not stock_info.empty:
-                    name = stock_info.iloc[0]['name']
-                    code = stock_info.iloc[0]['code']
-                else:
-                    name = ticker
-                    code = ticker.replace('.T', '')
-                
-                stock_data = get_stock_data(ticker, '3mo', '1d')  # 90日分取得
-                
-                selected_stocks_data.append({
-                    'ticker': ticker,
-                    'name': name,
-                    'code': code,
-                    'data': stock_data
-                })
-                
-                progress_bar.progress((i + 1) / len(st.session_state.selected_stocks))
-            
-            progress_bar.empty()
-            
-            # マルチチャート作成
-            multi_chart = create_multi_chart(selected_stocks_data)
-            
-            if multi_chart:
-                st.plotly_chart(multi_chart, use_container_width=True)
-                
-                # 銘柄別最新価格
-                st.subheader("💰 銘柄別最新価格")
-                
-                cols = st.columns(4)
-                for i, stock_data in enumerate(selected_stocks_data[:12]):
-                    with cols[i % 4]:
-                        if stock_data['data'] is not None and not stock_data['data'].empty:
-                            latest = stock_data['data'].iloc[-1]
-                            prev_close = stock_data['data'].iloc[-2]['Close'] if len(stock_data['data']) > 1 else latest['Close']
-                            change = latest['Close'] - prev_close
-                            change_pct = (change / prev_close) * 100 if prev_close != 0 else 0
-                            
-                            st.metric(
-                                label=f"{stock_data['code']} {stock_data['name'][:8]}",
-                                value=f"¥{latest['Close']:,.0f}",
-                                delta=f"{change_pct:+.2f}%"
-                            )
-                        else:
-                            st.metric(
-                                label=f"{stock_data['code']} {stock_data['name'][:8]}",
-                                value="データなし",
-                                delta=None
-                            )
-            else:
-                st.error("チャートの作成に失敗しました")
+    annotate(view={"🔎 スクリーナー": 'screener', "🏭 業種": 'sectors'}.get(view_mode, 'chart'),
+             period=chart_period, interval=chart_interval, live=live,
+             selected=len(st.session_state.selected_stocks))
+    if view_mode == "🔎 スクリーナー":
+        with stage('screener'):
+            render_screener(stock_df)
+    elif view_mode == "🏭 業種":
+        with stage('sectors'):
+            render_sector_dashboard(stock_df)
+    elif st.session_state.selected_stocks:
+        render = render_live_chart_area if live else render_chart_area
+        render(stock_info_map, chart_period, max_points, tile_mode, chart_interval)
     else:
-        st.info("左側のサイドバーから銘柄を選択してください（最大12銘柄）")
+        st.info(f"左側のサイドバーから銘柄を選択してください（最大{MAX_SELECTED_STOCKS}銘柄）")
     
     # フッター
     st.markdown("---")
@@ -517,11 +1124,41 @@ def main():
     - **ドラッグ**: チャートをドラッグして期間を移動
     - **ズーム**: マウスホイールで拡大縮小
     - **リセット**: ダブルクリックでズームリセット
-    - **データ範囲**: 90日分のデータを格納、初期表示は最新20日分
+    - **データ範囲**: 表示期間のデータを格納、初期表示は最新20本（古い足は描画本数の上限に応じて集約）
     """)
 
+def render_perf_panel(record):
+    """直近の再実行の計測結果をサイドバーに表示"""
+    with st.sidebar:
+        if not st.checkbox("🛠 計測パネルを表示", key='show_perf_panel'):
+            return
+        counters = record['counters']
+        st.caption(f"再実行 {record['total_s']:.3f}秒 ・ {record['timestamp']}")
+        stages = pd.DataFrame({'秒': record['stages']}).sort_values('秒', ascending=False)
+        st.dataframe(stages, use_container_width=True, column_config={'秒': st.column_config.NumberColumn(format="%.3f")})
+        if 'fetch_calls' in counters:
+            st.write(f"株価キャッシュ: 命中 {counters['fetch_hits']}（期限切れ {counters.get('fetch_stale', 0)}・"
+                     f"取得待ち {counters.get('fetch_shared', 0)}） / 取得 {counters.get('fetch_misses', 0)}"
+                     f"（{counters.get('fetched_bytes', 0) / 1024:,.0f} KB）")
+        cache = get_fetch_coordinator().stats()
+        st.write(f"株価データのキャッシュ: {cache['entries']}件 ・ {cache['bytes'] / 1024 / 1024:.1f}"
+                 f" / {cache['max_bytes'] / 1024 / 1024:.0f} MB ・ 追い出し {cache['evictions']}回")
+        if 'figure_traces' in counters:
+            st.write(f"チャート: {counters['figure_traces']}トレース ・ {counters['figure_points']:,}点"
+                     f"（図の作成 {counters.get('chart_builds', 0)}回）")
+
 if __name__ == "__main__":
-    main()
+    # 再実行ごとに段階別の処理時間を計測し、ログに追記する
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = os.urandom(4).hex()
+    profile = RerunProfile(session=st.session_state.session_id)
+    try:
+        with use_profile(profile):
+            main()
+    finally:
+        perf_record = profile.record()
+        append_log(perf_record)
+    render_perf_panel(perf_record)
 
 
 
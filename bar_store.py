@@ -0,0 +1,231 @@
+"""株価バーの永続ストア（銘柄・足種ごとのParquetに差分追記）"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from market_data import MARKET_TZ, OHLCV_COLUMNS
+from vwap import BAND_COLUMNS, StreamingVWAPBands, update_vwap_bands, calculate_vwap_bands
+
+# period指定をさかのぼる期間に換算（'max' は全期間）
+PERIOD_OFFSETS = {
+    '1d': pd.DateOffset(days=1),
+    '5d': pd.DateOffset(days=7),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10),
+}
+
+# 全期間取得時の取得開始日
+EPOCH = pd.Timestamp('1970-01-01', tz=MARKET_TZ)
+
+# 足種ごとに保持する期間（追記のたびにこれより古い足を捨てる）。日足はチャートで選べる最長の
+# 5年、分足はチャートに表示する1ヶ月。より長い期間が必要になったときは全期間を取得し直す
+RETENTION = {'1d': '5y', '5m': '1mo'}
+
+# 保持期間の先頭の足のバンドを計算し直せるよう、その前に残す足数（2*period-1本）
+BAND_LOOKBACK = 2 * 20 - 1
+
+# 取得元が過去の足をさかのぼって調整する（auto_adjust）きっかけになる列
+ADJUSTMENT_COLUMNS = ['Dividends', 'Stock Splits']
+
+# Parquetのスキーマメタデータに保存する「この日以降は欠けなく保持している」日時
+COVERED_FROM_KEY = b'keep_stock.covered_from'
+
+def period_start(period, now):
+    """period指定で必要になる最古の日時"""
+    if period == 'max':
+        return EPOCH
+    if period == 'ytd':
+        return now.normalize().replace(month=1, day=1)
+    return now - PERIOD_OFFSETS.get(period, PERIOD_OFFSETS['3mo'])
+
+def slice_period(df, period):
+    """保存済みの全履歴から最終バーを基準に period 分を切り出す"""
+    if df.empty:
+        return df
+    if period in ('1d', '5d'):
+        # 日数指定は営業日ベースで数える
+        days = df.index.normalize().unique()[-int(period[:-1]):]
+        return df[df.index.normalize() >= days[0]]
+    return df[df.index >= period_start(period, df.index[-1])]
+
+def unchanged_bars(stored, bars):
+    """bars の各足が保存済みの同じ時刻の足とOHLCVまで一致するか（空なら True）"""
+    if bars.empty:
+        return True
+    saved = stored.reindex(bars.index)[OHLCV_COLUMNS].to_numpy(dtype=float)
+    return bool(np.array_equal(saved, bars[OHLCV_COLUMNS].to_numpy(dtype=float)))
+
+def new_adjustments(stored, new):
+    """new に保存済みでない分割・配当があるか
+
+    あれば取得元はそれより前の足をすべて調整し直しているため、保存済みの足は使えない。
+    """
+    columns = [col for col in ADJUSTMENT_COLUMNS if col in new.columns]
+    events = new[columns].fillna(0)
+    events = events[(events != 0).any(axis=1)]
+    if events.empty:
+        return False
+    if not all(col in stored.columns for col in columns):
+        return True
+    saved = stored.reindex(events.index)[columns].fillna(0)
+    return not np.array_equal(saved.to_numpy(), events.to_numpy())
+
+class BarStore:
+    """銘柄・足種ごとのOHLCVとVWAPバンドをParquetで保持し、差分だけ取得して追記する"""
+
+    def __init__(self, root=None, max_age=300, retention=None):
+        self.root = root or os.path.join(os.environ.get('STOCK_DATA_DIR', 'data'), 'bars')
+        # 最終更新からこの秒数以内なら取得せずディスクの内容を返す
+        self.max_age = max_age
+        # 足種 → 保持する期間（period指定。ない足種は捨てない）
+        self.retention = RETENTION if retention is None else retention
+        # (ticker, interval) → 保存済みの最終足まで追加したバンドの計算器（次の更新では新しい足だけ追加する）
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+
+    def path(self, ticker, interval):
+        return os.path.join(self.root, interval, f"{ticker}.parquet")
+
+    def load(self, ticker, interval):
+        """保存済みのバーと欠けなく保持している開始日時を読み込む"""
+        path = self.path(ticker, interval)
+        if not os.path.exists(path):
+            return None, None
+        table = pq.ParquetFile(path).read()
+        covered_from = (table.schema.metadata or {}).get(COVERED_FROM_KEY)
+        if covered_from is not None:
+            covered_from = pd.Timestamp(covered_from.decode())
+        return table.to_pandas(), covered_from
+
+    def read_recent(self, ticker, interval, bars, columns=('High', 'Low', 'Close', 'Volume')):
+        """保存済みの末尾bars本を指定列だけ読む（全銘柄スキャン用の軽量な読み込み）"""
+        path = self.path(ticker, interval)
+        if not os.path.exists(path):
+            return None
+        parquet_file = pq.ParquetFile(path)
+        # pandasのインデックスは最後の列として保存されている
+        index_col = parquet_file.schema_arrow.names[-1]
+        table = parquet_file.read(columns=list(columns) + [index_col])
+        table = table.slice(max(0, table.num_rows - bars))
+        timestamps = table.column(index_col)
+        index = pd.DatetimeIndex(timestamps.to_numpy(), name=index_col)
+        if timestamps.type.tz:
+            index = index.tz_localize('UTC').tz_convert(timestamps.type.tz)
+        return pd.DataFrame({col: table.column(col).to_numpy() for col in columns}, index=index)
+
+    def save(self, ticker, interval, df, covered_from):
+        """一時ファイルに書いてから置き換える（同時アクセスでも壊れたファイルを読ませない）"""
+        path = self.path(ticker, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df)
+        metadata = dict(table.schema.metadata or {})
+        metadata[COVERED_FROM_KEY] = covered_from.isoformat().encode()
+        table = table.replace_schema_metadata(metadata)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def has(self, ticker, interval):
+        return os.path.exists(self.path(ticker, interval))
+
+    def is_fresh(self, ticker, interval):
+        path = self.path(ticker, interval)
+        return os.path.exists(path) and time.time() - os.path.getmtime(path) < self.max_age
+
+    def refresh(self, ticker, period, interval, fetcher):
+        """保存済みの最終バー以降だけ取得して追記し、period 分のバーを返す"""
+        now = pd.Timestamp.now(tz=MARKET_TZ)
+        need_from = period_start(period, now)
+        stored, covered_from = self.load(ticker, interval)
+
+        if stored is None or stored.empty or covered_from is None or need_from < covered_from:
+            # 初回、または保存分より古い期間が必要な場合は全期間を取得し直す
+            return self._refetch(ticker, period, interval, fetcher, need_from)
+
+        if self.is_fresh(ticker, interval):
+            return slice_period(stored, period).copy()
+
+        # 最終バーは確定していない可能性があるため、その日の分から取り直す
+        last = stored.index[-1]
+        new = fetcher.history(ticker, period=period, interval=interval,
+                              start=last.strftime('%Y-%m-%d')).dropna()
+        if new_adjustments(stored, new):
+            # 分割・配当で過去の足が調整し直されたので、保存分を捨てて全期間を取得し直す
+            return self._refetch(ticker, period, interval, fetcher, need_from)
+        if unchanged_bars(stored, new[new.index < last]):
+            # 前回の最終足より前は変わっていないので、最終足（形成中だった足）以降だけ差し替える
+            new = new[new.index >= last]
+        if new.empty:
+            os.utime(self.path(ticker, interval))
+            return slice_period(stored, period).copy()
+
+        kept = stored[stored.index < new.index[0]]
+        merged = pd.concat([kept, new])
+        merged = merged[~merged.index.duplicated(keep='last')]
+        merged = self._update_bands(ticker, interval, merged, len(merged) - len(kept), last)
+        merged, covered_from = self._trim(merged, covered_from, period, interval)
+        self.save(ticker, interval, merged, covered_from)
+        return slice_period(merged, period).copy()
+
+    def _refetch(self, ticker, period, interval, fetcher, need_from):
+        """period 分を取得し直して保存分を置き換える"""
+        df = fetcher.history(ticker, period=period, interval=interval)
+        if df.empty:
+            return None
+        df = calculate_vwap_bands(df.dropna())
+        self._set_engine(ticker, interval, df)
+        self.save(ticker, interval, df, need_from)
+        return slice_period(df, period).copy()
+
+    def _trim(self, df, covered_from, period, interval):
+        """最終バーから数えて保持期間（と period）より古い足を捨てる。戻り値は (残した足, 新しい保持開始日時)
+
+        追記のたびにファイル全体を読み書きするため、捨てないと分足のファイルが際限なく大きくなる。
+        """
+        keep = self.retention.get(interval)
+        if keep is None:
+            return df, covered_from
+        cutoff = min(period_start(keep, df.index[-1]), period_start(period, df.index[-1]))
+        start = int(df.index.searchsorted(cutoff)) - BAND_LOOKBACK
+        if start <= 0:
+            return df, covered_from
+        return df.iloc[start:], df.index[start]
+
+    def _set_engine(self, ticker, interval, df):
+        """df の末尾まで追加したバンドの計算器を次の更新用に保持する"""
+        engine = StreamingVWAPBands()
+        # 偏差の移動和までそろえるには直前 2*period-1 本があれば足りる
+        engine.extend(df.iloc[-(2 * engine.period - 1):])
+        with self._engines_lock:
+            self._engines[(ticker, interval)] = engine
+
+    def _update_bands(self, ticker, interval, merged, n_new, last):
+        """末尾 n_new 本（last 以降）のバンドを更新
+
+        前回の更新で last まで進めた計算器があれば、新しい足だけを1本ずつO(1)で追加する
+        （last と同じ時刻の足は形成中の足の置き換え）。なければ update_vwap_bands で
+        末尾を再計算し、次回用の計算器を作る。
+        """
+        with self._engines_lock:
+            engine = self._engines.pop((ticker, interval), None)
+        resumable = (engine is not None and engine.last_timestamp == last and n_new > 0
+                     and merged.index[-n_new] == last and all(col in merged.columns for col in BAND_COLUMNS))
+        if not resumable:
+            merged = update_vwap_bands(merged, n_new)
+            self._set_engine(ticker, interval, merged)
+            return merged
+        columns = [merged.columns.get_loc(col) for col in BAND_COLUMNS]
+        merged.iloc[-n_new:, columns] = engine.extend(merged.iloc[-n_new:])
+        with self._engines_lock:
+            self._engines[(ticker, interval)] = engine
+        return merged
@@ -0,0 +1,240 @@
+"""オフライン ベンチマーク（疑似データで読み込み・取得・バンド計算・チャート作成を計測）
+
+    python bench.py                                # 全シナリオを実行して bench_results/ に保存
+    python bench.py --only cold_grid warm_rerun    # 一部のシナリオだけ実行
+    python bench.py --compare bench_results/前回.json  # 以前の結果と比較
+
+yfinance の代わりに market_data.FakeFetcher を使うため、ネットワークなしで実行できる。
+各シナリオの実時間・ピークメモリ（tracemalloc）・チャートのJSONサイズを記録する。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# app を読み込む前に疑似データとバーストアの保存先を設定する
+os.environ['STOCK_FETCHER'] = 'fake'
+os.environ.setdefault('STOCK_DATA_DIR', tempfile.mkdtemp(prefix='bench_'))
+
+import streamlit.logger
+
+# Streamlit外での実行時に出る ScriptRunContext の警告を抑える
+streamlit.logger.set_log_level('error')
+
+import app
+from bar_store import BarStore
+from market_data import FakeFetcher, fetch_as_completed
+from screener import screen_universe
+from vwap import BandPanel, calculate_vwap_bands
+
+RESULTS_DIR = 'bench_results'
+
+def measure(fn):
+    """fn を実行して (戻り値, 実時間[秒], ピークメモリ[MB]) を返す"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, wall, peak / 1024 / 1024
+
+def reset_fetch_cache(fetcher):
+    """取得キャッシュとバーストアを空にして、疑似フェッチャーを差し替える"""
+    app.get_fetch_coordinator().clear()
+    app.build_multi_chart.clear()
+    app.build_ticker_traces.clear()
+    app.build_tile_chart.clear()
+    app.fetcher = app.RateLimitedFetcher(fetcher, app.TokenBucket(app.FETCH_RATE, app.FETCH_BURST))
+    app.bar_store = BarStore(root=tempfile.mkdtemp(prefix='bench_bars_'), max_age=0)
+
+def grid_data(tickers, period, interval):
+    """チャート1ページ分のデータを取得して create_multi_chart の入力を作る"""
+    info_map = app.get_stock_info_map()
+    data_map = app.get_stock_data_batch(tickers, period, interval)
+    return [
+        {'ticker': info.ticker, 'name': info.name, 'code': info.code, 'data': data_map.get(info.ticker)}
+        for info in app.lookup_stock_info(info_map, tickers)
+    ]
+
+def render_grid(tickers, period, interval, cached=False):
+    """取得→チャート作成→JSON化（ブラウザへ送る量）までの1回分の描画"""
+    data = grid_data(tickers, period, interval)
+    if cached:
+        fig = app.build_multi_chart(app.chart_data_key(data), data, app.CHART_MAX_POINTS)
+    else:
+        fig = app.create_multi_chart(data, max_points=app.CHART_MAX_POINTS)
+    payload = fig.to_json()
+    return {'traces': len(fig.data), 'json_kb': round(len(payload) / 1024, 1)}
+
+def run_scenarios(args):
+    """シナリオ名 → 計測関数（事前準備が必要なものは関数内で行う）"""
+    universe = app.load_stock_data()
+    tickers = list(universe['ticker'][:app.CHART_PAGE_SIZE])
+
+    def fetcher():
+        return FakeFetcher(latency=args.latency, jitter=args.latency / 2, failure_rate=args.failure_rate)
+
+    def load_universe():
+        app.load_stock_data.clear()
+        return measure(lambda: {'rows': len(app.load_stock_data())})
+
+    def cold_grid():
+        reset_fetch_cache(fetcher())
+        return measure(lambda: render_grid(tickers, '3mo', '1d'))
+
+    def warm_rerun():
+        reset_fetch_cache(fetcher())
+        render_grid(tickers, '3mo', '1d', cached=True)
+        return measure(lambda: render_grid(tickers, '3mo', '1d', cached=True))
+
+    def cold_tiles():
+        # 銘柄ごとのタイルを届いた順に作る（最初の1枚までの時間も記録）
+        reset_fetch_cache(fetcher())
+        info_map = app.get_stock_info_map()
+
+        async def render_tiles():
+            started = time.perf_counter()
+            first_tile = None
+            json_bytes = 0
+            async for ticker, df, error in fetch_as_completed(tickers, app.stock_history_fetcher('3mo', '1d')):
+                info = info_map[ticker]
+                stock_data = {'ticker': ticker, 'name': info.name, 'code': info.code, 'data': df}
+                fig = app.build_tile_chart(app.ticker_data_key(stock_data), stock_data, app.CHART_MAX_POINTS)
+                json_bytes += len(fig.to_json())
+                if first_tile is None:
+                    first_tile = time.perf_counter() - started
+            return {'first_tile_s': round(first_tile, 3), 'json_kb': round(json_bytes / 1024, 1)}
+        return measure(lambda: asyncio.run(render_tiles()))
+
+    def history_1y():
+        reset_fetch_cache(fetcher())
+        return measure(lambda: render_grid(tickers, '1y', '1d'))
+
+    def intraday_5m():
+        reset_fetch_cache(fetcher())
+        return measure(lambda: render_grid(tickers, '1mo', '5m'))
+
+    def intraday_1m():
+        reset_fetch_cache(fetcher())
+        return measure(lambda: render_grid(tickers, '5d', '1m'))
+
+    def timeframe_switch():
+        # 日足を取得済みの状態で週足・月足に切り替える（取得し直さずに集約だけ）
+        reset_fetch_cache(fetcher())
+        render_grid(tickers, '1y', '1d')
+        calls = app.fetcher.fetcher.calls
+
+        def switch():
+            result = {}
+            for interval in ('1wk', '1mo'):
+                result[f"{interval}_json_kb"] = render_grid(tickers, '1y', interval)['json_kb']
+            result['fetches'] = app.fetcher.fetcher.calls - calls
+            return result
+        return measure(switch)
+
+    def vwap_bands():
+        frames = {ticker: FakeFetcher().history(ticker, '1y', '1d') for ticker in tickers}
+
+        def compute():
+            for df in frames.values():
+                calculate_vwap_bands(df.copy())
+            BandPanel.from_frames(frames)
+            return {'tickers': len(frames)}
+        return measure(compute)
+
+    def universe_scan():
+        # 1回目で疑似データをバーストアに保存し、2回目（キャッシュ済み）を計測する
+        scan_universe = universe.head(args.universe_limit) if args.universe_limit else universe
+        store = BarStore(root=tempfile.mkdtemp(prefix='bench_scan_'))
+        scan_fetcher = FakeFetcher()
+
+        def load(ticker):
+            df = store.read_recent(ticker, '1d', app.SCREENER_BARS)
+            return df if df is not None else store.refresh(ticker, '3mo', '1d', scan_fetcher)
+        screen_universe(scan_universe, load)
+
+        def scan():
+            results, timings, errors = screen_universe(scan_universe, load)
+            return {'tickers': len(scan_universe), 'hits': len(results), 'errors': len(errors),
+                    **{f"{stage}_s": round(seconds, 3) for stage, seconds in timings.items()}}
+        return measure(scan)
+
+    return {
+        'load_universe': load_universe,
+        'cold_grid': cold_grid,
+        'warm_rerun': warm_rerun,
+        'cold_tiles': cold_tiles,
+        'history_1y': history_1y,
+        'intraday_5m': intraday_5m,
+        'intraday_1m': intraday_1m,
+        'timeframe_switch': timeframe_switch,
+        'vwap_bands': vwap_bands,
+        'universe_scan': universe_scan,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+def print_results(results, baseline=None):
+    base = (baseline or {}).get('scenarios', {})
+    print(f"{'scenario':<16}{'wall[s]':>10}{'peak[MB]':>10}{'json[KB]':>10}  {'vs baseline':<12} extra")
+    for name, result in results['scenarios'].items():
+        extra = {k: v for k, v in result.items() if k not in ('wall_s', 'peak_mb', 'json_kb')}
+        ratio = ''
+        if name in base and base[name]['wall_s']:
+            ratio = f"x{result['wall_s'] / base[name]['wall_s']:.2f}"
+        print(f"{name:<16}{result['wall_s']:>10.3f}{result['peak_mb']:>10.1f}"
+              f"{result.get('json_kb', ''):>10}  {ratio:<12} {extra}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', help='実行するシナリオ名')
+    parser.add_argument('--latency', type=float, default=0.05, help='疑似フェッチの遅延[秒]')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='疑似フェッチの失敗率')
+    parser.add_argument('--universe-limit', type=int, default=0, help='スキャンする銘柄数（0は全銘柄）')
+    parser.add_argument('--compare', help='比較する以前の結果JSON')
+    parser.add_argument('--no-save', action='store_true', help='結果を保存しない')
+    args = parser.parse_args()
+
+    scenarios = run_scenarios(args)
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'args': vars(args),
+        'scenarios': {},
+    }
+    for name, scenario in scenarios.items():
+        if args.only and name not in args.only:
+            continue
+        extra, wall, peak = scenario()
+        results['scenarios'][name] = {'wall_s': round(wall, 4), 'peak_mb': round(peak, 2), **extra}
+        print(f"  {name}: {wall:.3f}s", file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{results['commit']}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"saved: {path}")
+
+if __name__ == "__main__":
+    main()
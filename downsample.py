@@ -0,0 +1,60 @@
+"""チャート描画用の間引き（表示範囲付近は全足、古い部分はバケットに集約）"""
+import numpy as np
+
+def lod_buckets(n, max_points, full_resolution):
+    """n本の足を max_points 個以下のバケットに分け、各バケットの開始位置を返す
+
+    末尾 full_resolution 本は1本1バケットのまま残し、
+    それより古い部分を残りの点数で均等に分割する。
+    """
+    if n <= max_points:
+        return np.arange(n)
+    full_resolution = min(full_resolution, max_points - 1, n)
+    head = n - full_resolution
+    head_buckets = max(max_points - full_resolution, 1)
+    head_starts = np.unique(np.linspace(0, head, head_buckets, endpoint=False).astype(int))
+    return np.concatenate([head_starts, np.arange(head, n)])
+
+def bucket_ids(n, starts):
+    """各足が属するバケット番号"""
+    return np.searchsorted(starts, np.arange(n), side='right') - 1
+
+def aggregate_ohlc(open_, high, low, close, starts):
+    """バケットごとに始値・高値・安値・終値を集約"""
+    ends = np.append(starts[1:], len(close)) - 1
+    return (
+        open_[starts],
+        np.maximum.reduceat(high, starts),
+        np.minimum.reduceat(low, starts),
+        close[ends],
+    )
+
+def lttb_select(values, starts):
+    """LTTB方式で各バケットから形状を最もよく表す1点を選び、その値を返す
+
+    前後のバケットの平均点と作る三角形の面積が最大になる点を選ぶ
+    （前バケットも選択点ではなく平均を使うことで全バケットを一括計算する）。
+    NaNのみのバケットは NaN になる。
+    """
+    n = len(values)
+    if len(starts) == n:
+        return values
+    bucket = bucket_ids(n, starts)
+    x = np.arange(n, dtype=float)
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid.astype(float), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.add.reduceat(np.where(valid, x, 0.0), starts) / counts
+        mean_y = np.add.reduceat(np.where(valid, values, 0.0), starts) / counts
+    # 端のバケットは自分自身の平均を前後の代わりに使う
+    prev_x = np.concatenate([mean_x[:1], mean_x[:-1]])[bucket]
+    prev_y = np.concatenate([mean_y[:1], mean_y[:-1]])[bucket]
+    next_x = np.concatenate([mean_x[1:], mean_x[-1:]])[bucket]
+    next_y = np.concatenate([mean_y[1:], mean_y[-1:]])[bucket]
+    area = np.abs((prev_x - next_x) * (values - prev_y) - (prev_x - x) * (next_y - prev_y))
+    area = np.where(valid, np.nan_to_num(area, nan=0.0), -1.0)
+
+    # バケット内で面積最大の点（同じバケット内は面積の降順に並べて先頭を取る）
+    order = np.lexsort((-area, bucket))
+    first = np.searchsorted(bucket[order], np.arange(len(starts)))
+    return values[order[first]]
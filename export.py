@@ -0,0 +1,162 @@
+"""VWAPバンドとタッチ判定の一括出力（ブラウザを使わない夜間バッチ・他ツール連携用）
+
+    python export.py --universe -o bands.parquet                 # 全銘柄
+    python export.py --sector 電気機器 -o denki.csv               # 業種
+    python export.py --watchlist watchlists/主力.json -o wl.parquet --touches-only
+
+銘柄をチャンクに分けて取得（並列）→バンド計算→書き出しを繰り返すため、
+全銘柄分を一度にメモリに載せない。出力形式は拡張子（.parquet / .csv）で決まる。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bar_store import BarStore
+from market_data import OHLCV_COLUMNS, TokenBucket, RateLimitedFetcher, get_fetcher, fetch_many
+from resample import base_interval, resample_bars
+from screener import filter_universe
+from universe import load_universe
+from vwap import BAND_COLUMNS, TOUCH_COLUMNS, BandPanel, band_frame
+
+# 出力する列（ticker と timestamp の後に並べる）
+EXPORT_COLUMNS = OHLCV_COLUMNS + BAND_COLUMNS + list(TOUCH_COLUMNS)
+
+def resolve_tickers(stock_df, watchlist=None, sector=None):
+    """ウォッチリストのJSON、業種、または銘柄表の全銘柄から対象のtickerを決める"""
+    if watchlist:
+        with open(watchlist, encoding='utf-8') as f:
+            return list(dict.fromkeys(json.load(f)))
+    if sector:
+        return list(filter_universe(stock_df, sectors=[sector])['ticker'])
+    return list(stock_df['ticker'])
+
+def band_rows(frames, touches_only=False):
+    """{ticker: OHLCV} からバンドとタッチ判定付きの縦長のフレームを作る
+
+    バーストアで計算済みのバンドの列があればそれを使い、ない銘柄（集約した足など）だけ
+    まとめて計算する。
+    """
+    stored = {ticker: band_frame(df) for ticker, df in frames.items() if df is not None and not df.empty}
+    band_panel = BandPanel.from_frames({ticker: frames[ticker] for ticker, bands in stored.items() if bands is None})
+    parts = []
+    for ticker, bands in stored.items():
+        df = frames[ticker]
+        rows = band_panel.ticker_frame(ticker) if bands is None else bands
+        for col in OHLCV_COLUMNS:
+            rows[col] = df[col].to_numpy()
+        if touches_only:
+            rows = rows[rows[list(TOUCH_COLUMNS)].any(axis=1)]
+        rows = rows.rename_axis('timestamp').reset_index()
+        rows.insert(0, 'ticker', ticker)
+        parts.append(rows)
+    if not parts:
+        return None
+    result = pd.concat(parts, ignore_index=True)
+    return result[['ticker', 'timestamp'] + EXPORT_COLUMNS].astype({'Volume': 'int64'})
+
+class ChunkWriter:
+    """チャンクごとにParquet（同一スキーマで追記）またはCSV（ヘッダーは最初だけ）に書き出す"""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = 'csv' if path.lower().endswith('.csv') else 'parquet'
+        self._writer = None
+        self._wrote_header = False
+
+    def write(self, df):
+        if self.format == 'csv':
+            df.to_csv(self.path, mode='a' if self._wrote_header else 'w',
+                      header=not self._wrote_header, index=False)
+            self._wrote_header = True
+            return
+        if self._writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def export_bands(tickers, output, period='3mo', interval='1d', store=None, fetcher=None,
+                 chunk_size=200, max_workers=8, touches_only=False, on_progress=None):
+    """tickers のバンドとタッチ判定を output に書き出す
+
+    chunk_size 銘柄ずつ max_workers 並列で取得し、チャンクごとにまとめてバンドを計算して
+    書き出す。取得はバーストア経由（保存済みで新しければ取得しない）で、週足・月足などは
+    元の足種（resample.BASE_INTERVALS）を取得して集約する。
+    戻り値は {'tickers', 'rows', 'errors': {ticker: 例外}, 'seconds'}。
+    on_progress(処理済み銘柄数, 総数) はチャンクごとに呼ばれる。
+    """
+    store = store or BarStore()
+    fetcher = fetcher or get_fetcher()
+    started = time.perf_counter()
+    writer = ChunkWriter(output)
+
+    def load(ticker):
+        return resample_bars(store.refresh(ticker, period, base_interval(interval), fetcher), interval)
+
+    rows = 0
+    errors = {}
+    try:
+        for start in range(0, len(tickers), chunk_size):
+            chunk = tickers[start:start + chunk_size]
+            frames, chunk_errors = fetch_many(chunk, load, max_workers=max_workers, timeout=None)
+            errors.update(chunk_errors)
+            result = band_rows(frames, touches_only)
+            if result is not None and len(result):
+                writer.write(result)
+                rows += len(result)
+            if on_progress:
+                on_progress(min(start + chunk_size, len(tickers)), len(tickers))
+    finally:
+        writer.close()
+    return {'tickers': len(tickers), 'rows': rows, 'errors': errors,
+            'seconds': time.perf_counter() - started}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--watchlist', help='ウォッチリストのJSON（tickerのリスト）')
+    source.add_argument('--sector', help='33業種区分')
+    source.add_argument('--universe', action='store_true', help='銘柄表の全銘柄')
+    parser.add_argument('-o', '--output', required=True, help='出力先（.parquet または .csv）')
+    parser.add_argument('--period', default='3mo', help='取得期間（yfinanceのperiod指定）')
+    parser.add_argument('--interval', default='1d', help='足種（yfinanceのinterval指定）')
+    parser.add_argument('--touches-only', action='store_true', help='バンドにタッチした足だけ出力')
+    parser.add_argument('--chunk-size', type=int, default=200, help='まとめて処理する銘柄数')
+    parser.add_argument('--workers', type=int, default=8, help='並列取得数')
+    parser.add_argument('--rate', type=float, default=4.0, help='取得元への毎秒の呼び出し上限')
+    parser.add_argument('--csv', default='data_j.csv', help='銘柄一覧CSV')
+    args = parser.parse_args()
+
+    tickers = resolve_tickers(load_universe(args.csv), args.watchlist, args.sector)
+    if not tickers:
+        parser.error('対象の銘柄がありません')
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    summary = export_bands(
+        tickers, args.output,
+        period=args.period,
+        interval=args.interval,
+        fetcher=RateLimitedFetcher(get_fetcher(), TokenBucket(args.rate, args.workers)),
+        chunk_size=args.chunk_size,
+        max_workers=args.workers,
+        touches_only=args.touches_only,
+        on_progress=lambda done, total: print(f"  {done}/{total}", file=sys.stderr)
+    )
+    for ticker, e in summary['errors'].items():
+        print(f"取得エラー ({ticker}): {e}", file=sys.stderr)
+    print(f"{summary['tickers']}銘柄 / {summary['rows']}行 → {args.output}"
+          f"（{summary['seconds']:.1f}秒、失敗 {len(summary['errors'])}銘柄）")
+    return 1 if len(summary['errors']) == summary['tickers'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""再実行ごとの段階別の処理時間・キャッシュ命中数の計測（計測パネルとJSON Linesログ用）
+
+    python instrumentation.py [ログのパス]    # ログを段階ごとに集計して表示
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# 計測中のプロファイル（取得スレッドからも記録できるようスレッドごとに保持）
+_local = threading.local()
+_log_lock = threading.Lock()
+
+def default_log_path():
+    """ログの保存先（環境変数 STOCK_PERF_LOG を空にすると記録しない）"""
+    default = os.path.join(os.environ.get('STOCK_DATA_DIR', 'data'), 'logs', 'reruns.jsonl')
+    return os.environ.get('STOCK_PERF_LOG', default)
+
+class RerunProfile:
+    """1回の再実行の段階ごとの所要時間とカウンタ（複数スレッドから加算できる）"""
+
+    def __init__(self, **context):
+        self.context = dict(context)
+        self.stages = {}
+        self.counters = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self):
+        """ログ1行分の辞書"""
+        with self._lock:
+            counters = dict(self.counters)
+            stages = {name: round(seconds, 4) for name, seconds in self.stages.items()}
+        if 'fetch_calls' in counters:
+            counters['fetch_hits'] = counters['fetch_calls'] - counters.get('fetch_misses', 0)
+        return {
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            **self.context,
+            'total_s': round(time.perf_counter() - self._started, 4),
+            'stages': stages,
+            'counters': counters,
+        }
+
+@contextmanager
+def use_profile(profile):
+    """このスレッドでの計測の記録先を profile にする"""
+    previous = getattr(_local, 'profile', None)
+    _local.profile = profile
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+
+def current_profile():
+    return getattr(_local, 'profile', None)
+
+@contextmanager
+def stage(name):
+    """現在のプロファイルに段階の所要時間を加算（計測中でなければ何もしない）"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+def add_time(name, seconds):
+    profile = current_profile()
+    if profile is not None:
+        profile.add_time(name, seconds)
+
+def count(name, n=1):
+    profile = current_profile()
+    if profile is not None:
+        profile.count(name, n)
+
+def annotate(**context):
+    """ログに残す再実行の条件（表示モード・期間など）を追加"""
+    profile = current_profile()
+    if profile is not None:
+        profile.context.update(context)
+
+class MeteredFetcher:
+    """フェッチャーが返したデータ量を現在のプロファイルに加算するラッパー"""
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+
+    def history(self, ticker, period='3mo', interval='1d', start=None):
+        df = self.fetcher.history(ticker, period=period, interval=interval, start=start)
+        count('fetched_rows', len(df))
+        count('fetched_bytes', int(df.memory_usage(index=True).sum()))
+        return df
+
+def append_log(record, path=None):
+    """1再実行分を JSON Lines で追記"""
+    path = default_log_path() if path is None else path
+    if not path:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _log_lock:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def summarize_log(path=None):
+    """ログを段階ごとの件数・中央値・p95・最大（秒）に集計"""
+    path = default_log_path() if path is None else path
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    rows = [{'stage': 'total', 'seconds': record['total_s']} for record in records]
+    for record in records:
+        rows.extend({'stage': name, 'seconds': seconds} for name, seconds in record['stages'].items())
+    seconds = pd.DataFrame(rows, columns=['stage', 'seconds']).groupby('stage')['seconds']
+    summary = seconds.agg(['count', 'median', 'max'])
+    summary.insert(2, 'p95', seconds.quantile(0.95))
+    return summary.sort_values('median', ascending=False)
+
+if __name__ == "__main__":
+    print(summarize_log(sys.argv[1] if len(sys.argv) > 1 else None).to_string(float_format='{:.3f}'.format))
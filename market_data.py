@@ -0,0 +1,384 @@
+"""株価データ取得レイヤー（フェッチャーの差し替えと複数銘柄の一括取得）"""
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+import numpy as np
+import pandas as pd
+
+from vwap import BAND_COLUMNS
+
+# 日本市場のタイムゾーン（yfinanceの返すインデックスに合わせる）
+MARKET_TZ = 'Asia/Tokyo'
+
+# yfinanceのperiod指定を営業日数に換算
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 21, '3mo': 63, '6mo': 126,
+    '1y': 245, '2y': 490, '5y': 1225, '10y': 2450, 'ytd': 150, 'max': 5000,
+}
+
+# 1日の取引時間（分）
+BARS_PER_DAY_MINUTES = 330
+
+# interval指定を分単位に換算（日足以上は None）
+INTERVAL_MINUTES = {
+    '1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30,
+    '60m': 60, '90m': 90, '1h': 60,
+    '1d': None, '5d': None, '1wk': None, '1mo': None, '3mo': None,
+}
+
+class YFinanceFetcher:
+    """yfinanceから株価履歴を取得するフェッチャー"""
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def history(self, ticker, period='3mo', interval='1d', start=None):
+        import yfinance as yf
+        if start is not None:
+            # start指定時はperiodを無視して差分だけ取得
+            return yf.Ticker(ticker).history(start=start, interval=interval, timeout=self.timeout)
+        return yf.Ticker(ticker).history(period=period, interval=interval, timeout=self.timeout)
+
+class FakeFetcher:
+    """オフライン検証用の疑似データフェッチャー（銘柄ごとに決定的なOHLCVを生成）"""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0, end=None, jitter=0.0, bars=None):
+        # latency 秒（± jitter 秒）待ってから返し、failure_rate の確率で例外を送出する
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.end = market_day(end)
+        # bars を指定するとperiodに関係なくその本数を返す
+        self.bars = bars
+        self.calls = 0
+        # 失敗の発生はリトライで回復できるよう呼び出しごとに抽選する
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def history(self, ticker, period='3mo', interval='1d', start=None):
+        with self._lock:
+            self.calls += 1
+            delay = max(self.latency + self._rng.uniform(-self.jitter, self.jitter), 0.0)
+            failed = self.failure_rate and self._rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise ConnectionError(f"simulated fetch failure: {ticker}")
+        rng = np.random.default_rng(zlib.crc32(f"{self.seed}:{ticker}".encode()))
+        index = synthetic_index(period, interval, self.end, start, None if start else self.bars)
+        return synthetic_ohlcv(index, rng)
+
+def market_day(value=None):
+    """日付を市場タイムゾーンの0時に揃える"""
+    ts = pd.Timestamp(value or '2025-07-31')
+    ts = ts.tz_localize(MARKET_TZ) if ts.tz is None else ts.tz_convert(MARKET_TZ)
+    return ts.normalize()
+
+def synthetic_index(period='3mo', interval='1d', end=None, start=None, bars=None):
+    """period/intervalに対応する取引時間のインデックスを生成
+
+    start指定時はその日以降、bars指定時は末尾からその本数。
+    """
+    end = market_day(end)
+    minutes = INTERVAL_MINUTES.get(interval)
+    if start is not None:
+        days = pd.bdate_range(start=market_day(start), end=end, tz=MARKET_TZ)
+    else:
+        day_count = PERIOD_DAYS.get(period, 63)
+        if bars is not None:
+            day_count = math.ceil(bars / (BARS_PER_DAY_MINUTES // minutes)) if minutes else bars
+        days = pd.bdate_range(end=end, periods=day_count, tz=MARKET_TZ)
+    if minutes is None:
+        return pd.DatetimeIndex(days, name='Date')[-bars:] if bars else pd.DatetimeIndex(days, name='Date')
+
+    # 前場 9:00-11:30、後場 12:30-15:30
+    sessions = []
+    for start, stop in (('09:00', '11:30'), ('12:30', '15:30')):
+        offsets = pd.timedelta_range(start=pd.Timedelta(f"{start}:00"),
+                                     end=pd.Timedelta(f"{stop}:00"),
+                                     freq=f'{minutes}min', closed='left')
+        sessions.append(offsets)
+    offsets = sessions[0].append(sessions[1])
+    stamps = (days.values[:, None] + offsets.values[None, :]).ravel()
+    # days.values はUTC基準のため、UTCとして解釈してから市場時間に戻す
+    index = pd.DatetimeIndex(stamps, name='Datetime').tz_localize('UTC').tz_convert(MARKET_TZ)
+    return index[-bars:] if bars else index
+
+def synthetic_ohlcv(index, rng):
+    """ランダムウォークでyfinance互換のOHLCVフレームを生成"""
+    n = len(index)
+    base = rng.uniform(300, 8000)
+    returns = rng.normal(0, 0.015, n)
+    close = base * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[base], close[:-1]]) * (1 + rng.normal(0, 0.003, n))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.integers(10_000, 2_000_000, n)
+    return pd.DataFrame({
+        'Open': open_,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': volume,
+        'Dividends': 0.0,
+        'Stock Splits': 0.0,
+    }, index=index)
+
+def get_fetcher():
+    """環境変数 STOCK_FETCHER に応じてフェッチャーを選択（既定はyfinance）"""
+    kind = os.environ.get('STOCK_FETCHER', 'yfinance')
+    if kind == 'fake':
+        return FakeFetcher(latency=float(os.environ.get('STOCK_FETCHER_LATENCY', '0')))
+    return YFinanceFetcher()
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（毎秒 rate 個補充し、最大 capacity 個まで貯まる）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """トークンを1つ取る（無ければ補充を待つ）。timeout 秒以内に取れなければ False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class RateLimitedFetcher:
+    """取得元への呼び出しをトークンバケットで制限するフェッチャーのラッパー
+
+    プロセス全体で1つのバケットを共有させると、全セッションの取得の合計が制限される。
+    """
+
+    def __init__(self, fetcher, bucket):
+        self.fetcher = fetcher
+        self.bucket = bucket
+
+    def history(self, ticker, period='3mo', interval='1d', start=None):
+        self.bucket.acquire()
+        return self.fetcher.history(ticker, period=period, interval=interval, start=start)
+
+class FetchCoordinator:
+    """プロセス全体で共有する取得結果のキャッシュと同時取得の調停
+
+    - 同じキーの同時取得は1回にまとめ、待っている呼び出し元は同じ結果を受け取る
+    - 取得から fresh_ttl 秒以内の結果はそのまま返す
+    - fresh_ttl を過ぎても max_stale 秒以内なら古い結果をすぐ返し、裏で1回だけ取り直す
+      （どちらも呼び出しごとに変えられる）
+    - 失敗はキャッシュしない（裏での取り直しが失敗した場合は古い結果を返し続ける）
+    - max_bytes を指定すると、sizeof(値) の合計がそれを超えないよう最も長く使われていない
+      エントリから追い出す
+
+    返すフレームは全セッションで共有されるため、呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, fresh_ttl=300, max_stale=3600, max_workers=4, max_bytes=None, sizeof=None):
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        # key → (値, 取得時刻, バイト数)。末尾ほど最近使われたもの
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='revalidate')
+        self.revalidate_errors = 0
+        self.nbytes = 0
+        self.evictions = 0
+
+    def get(self, key, load, refresh=False, fresh_ttl=None, max_stale=None):
+        """key の値を返す（無ければ load() で取得）。戻り値は (値, 'hit'|'stale'|'shared'|'miss')
+
+        refresh=True なら期限内でも取得し直す（実行中の取得があればその結果を待つ）。
+        fresh_ttl を渡すとこの呼び出しではその秒数を鮮度の期限にする（分足など更新の速いデータ用）。
+        max_stale=0 なら期限切れの結果は返さず、取り直した結果を待つ。
+        """
+        fresh_ttl = self.fresh_ttl if fresh_ttl is None else fresh_ttl
+        max_stale = self.max_stale if max_stale is None else max_stale
+        with self._lock:
+            entry = self._entries.get(key)
+            future = self._inflight.get(key)
+            if entry is not None and not refresh:
+                value, fetched_at, _ = entry
+                self._entries.move_to_end(key)
+                age = time.monotonic() - fetched_at
+                if age < fresh_ttl:
+                    return value, 'hit'
+                if age < fresh_ttl + max_stale:
+                    if future is None:
+                        future = self._inflight[key] = Future()
+                        self._executor.submit(self._revalidate, key, load, future)
+                    return value, 'stale'
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if owner:
+            self._run(key, load, future)
+        return future.result(), 'miss' if owner else 'shared'
+
+    def _run(self, key, load, future):
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+        size = self.sizeof(value)
+        with self._lock:
+            self._store(key, value, size)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def _store(self, key, value, size):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous[2]
+        self._entries[key] = (value, time.monotonic(), size)
+        self.nbytes += size
+        # 今入れたエントリ以外を古い順に追い出す
+        while self.max_bytes is not None and self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def _revalidate(self, key, load, future):
+        self._run(key, load, future)
+        if future.exception() is not None:
+            self.revalidate_errors += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """件数・合計バイト数・上限・追い出し回数"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+# キャッシュに残す列（配当・分割は持たない）
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def compact_ohlcv(df):
+    """OHLCVを小さい型で持つフレーム（価格は float32、出来高は符号なし整数）
+
+    バーストアで計算済みのVWAPバンドの列があれば、それも float32 で残す。
+    """
+    data = {col: df[col].to_numpy(dtype=np.float32) for col in OHLCV_COLUMNS[:4]}
+    volume = np.nan_to_num(df['Volume'].to_numpy(dtype=float))
+    data['Volume'] = volume.astype(np.uint32 if volume.max(initial=0) < 2 ** 32 else np.int64)
+    if all(col in df.columns for col in BAND_COLUMNS):
+        data.update({col: df[col].to_numpy(dtype=np.float32) for col in BAND_COLUMNS})
+    return pd.DataFrame(data, index=df.index)
+
+def frame_nbytes(df):
+    """フレームのメモリ使用量（None は0）"""
+    return 0 if df is None else int(df.memory_usage(index=True).sum())
+
+def fetch_with_retry(fetch_one, ticker, retries=2, backoff=0.5):
+    """失敗時に指数バックオフでリトライしながら1銘柄を取得"""
+    for attempt in range(retries + 1):
+        try:
+            return fetch_one(ticker)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+def fetch_many(tickers, fetch_one, max_workers=8, timeout=30, retries=2, backoff=0.5,
+               on_progress=None):
+    """複数銘柄をスレッドプールで並列取得
+
+    戻り値は (results, errors)。results は入力順の {ticker: データ or None}、
+    errors は失敗した銘柄の {ticker: 例外}。一部が失敗しても成功分は返す。
+    on_progress(完了数, 総数) は呼び出し元スレッドで呼ばれる。
+    """
+    tickers = list(dict.fromkeys(tickers))
+    results = {ticker: None for ticker in tickers}
+    errors = {}
+    if not tickers:
+        return results, errors
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(tickers)))
+    futures = {
+        executor.submit(fetch_with_retry, fetch_one, ticker, retries, backoff): ticker
+        for ticker in tickers
+    }
+    done = 0
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            ticker = futures[future]
+            try:
+                results[ticker] = future.result()
+            except Exception as e:
+                errors[ticker] = e
+            done += 1
+            if on_progress:
+                on_progress(done, len(tickers))
+    except FuturesTimeoutError:
+        for future, ticker in futures.items():
+            if not future.done():
+                future.cancel()
+                errors[ticker] = TimeoutError(f"{timeout}秒以内に取得できませんでした")
+    finally:
+        # 応答の遅い銘柄を待たずに戻る
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results, errors
+
+async def fetch_as_completed(tickers, fetch_one, max_workers=8, timeout=30, retries=2, backoff=0.5):
+    """複数銘柄を一斉に取得し始め、終わった順に (ticker, データ, 例外) を返す非同期ジェネレータ
+
+    取得はスレッドプールで行い、待っている間もイベントループ側で結果を処理できる。
+    timeout 秒を過ぎても終わらない銘柄は TimeoutError として返す。
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(tickers)))
+    futures = {
+        loop.run_in_executor(executor, fetch_with_retry, fetch_one, ticker, retries, backoff): ticker
+        for ticker in tickers
+    }
+    deadline = loop.time() + timeout
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(deadline - loop.time(), 0),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        for future in pending:
+            yield futures[future], None, TimeoutError(f"{timeout}秒以内に取得できませんでした")
+    finally:
+        # 応答の遅い銘柄を待たずに戻る
+        executor.shutdown(wait=False, cancel_futures=True)
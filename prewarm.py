@@ -0,0 +1,97 @@
+"""保存済みウォッチリストの事前取得（サーバープロセス内のバックグラウンドスケジューラ）"""
+import threading
+import time
+from datetime import time as dtime
+
+import pandas as pd
+
+from market_data import MARKET_TZ, TokenBucket, fetch_many
+
+# 取引時間（前場開始〜大引け）と、寄り付き前に取得を始める時刻
+MARKET_OPEN = dtime(9, 0)
+MARKET_CLOSE = dtime(15, 30)
+PREOPEN = dtime(8, 45)
+
+def next_prewarm_time(now, interval, idle_interval=None):
+    """次に事前取得する日時
+
+    平日の寄り付き前（PREOPEN）から大引けまでは interval 秒ごと、
+    それ以外は idle_interval 秒ごと（None なら次の寄り付き前まで待つ）。
+    祝日は考慮しない。
+    """
+    if now.weekday() < 5 and PREOPEN <= now.time() < MARKET_CLOSE:
+        return now + pd.Timedelta(seconds=interval)
+    day = now.normalize()
+    if now.weekday() >= 5 or now.time() >= PREOPEN:
+        day += pd.offsets.BDay(1)
+    preopen = day + pd.Timedelta(hours=PREOPEN.hour, minutes=PREOPEN.minute)
+    if idle_interval is None:
+        return preopen
+    return min(preopen, now + pd.Timedelta(seconds=idle_interval))
+
+class PrewarmScheduler:
+    """list_tickers() の銘柄を定期的に warm_one(ticker) で取得し直すバックグラウンドスレッド
+
+    同時実行数は max_workers、取得の開始は毎秒 rate 件までに制限する。
+    interval を取得キャッシュのTTLより短くしておけば、取引時間中の
+    ウォッチリスト読み込みはキャッシュ命中になる。list_tickers() は銘柄の代わりに
+    (銘柄, 期間, 足種) の組など、warm_one に渡すハッシュ可能な値を返してもよい。
+    """
+
+    def __init__(self, warm_one, list_tickers, interval=240, idle_interval=1800,
+                 max_workers=4, rate=2.0):
+        self.warm_one = warm_one
+        self.list_tickers = list_tickers
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(rate)
+        # 直近の実行結果（{'finished', 'tickers', 'errors', 'seconds'}）と次回の予定
+        self.last_run = None
+        self.last_error = None
+        self.next_run = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='prewarm', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def wake(self):
+        """次の予定を待たずに取得する（ウォッチリスト保存時など）"""
+        self._wake.set()
+
+    def _warm(self, ticker):
+        self.bucket.acquire()
+        return self.warm_one(ticker)
+
+    def run_once(self):
+        """全ウォッチリストの銘柄を1回取得し直す"""
+        tickers = list(dict.fromkeys(self.list_tickers()))
+        started = time.perf_counter()
+        _, errors = fetch_many(tickers, self._warm, max_workers=self.max_workers,
+                               timeout=None, retries=1)
+        self.last_run = {
+            'finished': pd.Timestamp.now(tz=MARKET_TZ),
+            'tickers': len(tickers),
+            'errors': len(errors),
+            'seconds': time.perf_counter() - started,
+        }
+        return errors
+
+    def _loop(self):
+        # 起動直後に1回取得してから予定に従う
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = e
+            now = pd.Timestamp.now(tz=MARKET_TZ)
+            self.next_run = next_prewarm_time(now, self.interval, self.idle_interval)
+            self._wake.wait(max((self.next_run - now).total_seconds(), 0))
+            self._wake.clear()
@@ -0,0 +1,61 @@
+"""足種の変換（取得・キャッシュは元の足種だけにし、週足・月足や長い分足はローカルで集約）"""
+from datetime import time as dtime
+
+import numpy as np
+import pandas as pd
+
+from market_data import INTERVAL_MINUTES, OHLCV_COLUMNS
+
+# 表示できる足種 → 取得してキャッシュする元の足種
+BASE_INTERVALS = {
+    '1d': '1d', '1wk': '1d', '1mo': '1d',
+    '5m': '5m', '15m': '5m', '60m': '5m',
+}
+
+# 東証の前場・後場の開始時刻（分足は昼休みと日をまたいで集約しない）
+SESSION_OPENS = (dtime(9, 0), dtime(12, 30))
+
+# 集約のしかた（始値は最初、高値は最大、安値は最小、終値は最後、出来高は合計）
+OHLCV_AGGREGATION = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+def base_interval(interval):
+    """interval の足を作るのに取得する足種"""
+    return BASE_INTERVALS.get(interval, interval)
+
+def session_minutes(index):
+    """各足の (日付の先頭からの分, 属するセッションの開始の分)"""
+    minute_of_day = np.asarray(index.hour * 60 + index.minute)
+    morning, afternoon = (t.hour * 60 + t.minute for t in SESSION_OPENS)
+    return minute_of_day, np.where(minute_of_day >= afternoon, afternoon, morning)
+
+def bar_groups(index, interval):
+    """各足が属する集約後の足のキー（同じキーの足が1本にまとまる）
+
+    週足は週の月曜日、月足は年月、分足はセッション開始から interval 分ごとに区切った
+    足の開始時刻（UTCのナノ秒）。元の足にない日（祝日など）は集約後の足にも現れない。
+    """
+    if interval == '1wk':
+        return (index.normalize() - pd.to_timedelta(index.dayofweek, unit='D')).asi8
+    if interval == '1mo':
+        return np.asarray(index.year * 12 + index.month)
+    minutes = INTERVAL_MINUTES[interval]
+    minute_of_day, session_open = session_minutes(index)
+    bar_start = session_open + (minute_of_day - session_open) // minutes * minutes
+    return index.normalize().as_unit('ns').asi8 + bar_start * 60 * 10 ** 9
+
+def resample_bars(df, interval):
+    """元の足種のOHLCVを interval の足に集約（元の足種と同じならそのまま返す）
+
+    週足・月足の日付はその期間の最初の取引日、分足の時刻は足の開始時刻にする。
+    """
+    if df is None or df.empty or interval == base_interval(interval):
+        return df
+    keys = bar_groups(df.index, interval)
+    bars = df[OHLCV_COLUMNS].groupby(keys, sort=False).agg(OHLCV_AGGREGATION)
+    if INTERVAL_MINUTES.get(interval):
+        index = pd.DatetimeIndex(bars.index.to_numpy(dtype='datetime64[ns]')).tz_localize('UTC')
+        bars.index = index.tz_convert(df.index.tz) if df.index.tz else index.tz_localize(None)
+    else:
+        bars.index = df.index.to_series().groupby(keys, sort=False).first()
+    bars.index.name = df.index.name
+    return bars
@@ -0,0 +1,113 @@
+"""全銘柄スキャン（最新足でVWAPバンドにタッチした銘柄の抽出）"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from market_data import fetch_many
+from vwap import BandPanel
+
+# スクリーナーで選べるタッチ条件（表示名 → 判定列）
+TOUCH_LABELS = {
+    '+2σ': 'touch_u2',
+    '-2σ': 'touch_l2',
+    '+1σ': 'touch_u1',
+    '-1σ': 'touch_l1',
+}
+
+def filter_universe(stock_df, markets=None, sectors=None):
+    """市場区分・業種で銘柄表を絞り込む"""
+    mask = pd.Series(True, index=stock_df.index)
+    if markets:
+        mask &= stock_df['market'].isin(markets)
+    if sectors:
+        mask &= stock_df['sector'].isin(sectors)
+    return stock_df[mask]
+
+def screen_universe(stock_df, load_bars, touches=None, max_workers=16, on_progress=None):
+    """銘柄表の全銘柄について最新足のバンドタッチを判定
+
+    load_bars(ticker) は OHLCV フレーム（またはNone）を返す関数で、
+    ローカルのバーストアから読むものを渡す想定。
+    touches は TOUCH_COLUMNS の列名のリストで、いずれかにタッチした銘柄だけを返す
+    （None なら全銘柄）。
+    戻り値は (結果フレーム, 段階ごとの秒数, 取得に失敗した銘柄の {ticker: 例外})。
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    frames, errors = fetch_many(stock_df['ticker'], load_bars, max_workers=max_workers,
+                                timeout=None, retries=0, on_progress=on_progress)
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    band_panel = BandPanel.from_frames(frames)
+    timings['bands'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    latest = band_panel.latest()
+    close = band_panel.arrays['Close']
+    if not len(close):
+        # 読み込めた銘柄がない（保存済みのデータがないなど）：列だけ揃えた空の結果にする
+        close = np.empty((1, 0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prev_close = close[-2] if len(close) > 1 else close[-1]
+        latest['change_pct'] = (close[-1] - prev_close) / prev_close * 100
+        # VWAPからの乖離を標準偏差単位で（並べ替え用）
+        std_dev = latest['vwap_upper_1'] - latest['vwap']
+        latest['sigma'] = (latest['Close'] - latest['vwap']) / std_dev.replace(0, np.nan)
+
+    info = stock_df.set_index('ticker')[['code', 'name', 'market', 'sector']]
+    results = filter_touches(info.join(latest, how='inner'), touches)
+    results = results.rename(columns={'Close': 'close'}).reset_index()
+    timings['results'] = time.perf_counter() - started
+
+    return results, timings, errors
+
+def filter_touches(results, touches):
+    """touches（TOUCH_COLUMNS の列名のリスト）のいずれかにタッチした行だけ（None や空なら全行）"""
+    if not touches:
+        return results
+    return results[results[list(touches)].any(axis=1)]
+
+def latest_session(results):
+    """最新足の日付が最も多くの銘柄で一致する日（件数が同じなら新しい日）の銘柄だけに絞る
+
+    保存済みのバーは銘柄ごとに更新された時期が違うため、そのまま集計すると
+    違う日付の足が混ざる。最大の日付にしないのは、取引時間中にチャートを表示した
+    一部の銘柄だけが当日の形成中の足まで更新されているため。
+    戻り値は (絞り込んだ結果, 除いた銘柄数)。
+    """
+    dates = results['date'].value_counts()
+    session = dates[dates == dates.max()].index.max()
+    current = results[results['date'] == session]
+    return current, len(results) - len(current)
+
+def sector_summary(results):
+    """スキャン結果（screen_universe の戻り値）を業種ごとに集計
+
+    業種ごとの銘柄数、VWAPより上にある銘柄の割合[%]、±2σにタッチした銘柄の割合[%]、
+    前日比の中央値[%]を1回の groupby でまとめて計算する。VWAPを計算できない
+    （足が足りない）銘柄と業種なし（'-'）は除く。
+    """
+    members = results[results['vwap'].notna() & (results['sector'] != '-')]
+    flags = pd.DataFrame({
+        'sector': members['sector'],
+        'above_vwap': members['close'] > members['vwap'],
+        'touch_2s': members['touch_u2'] | members['touch_l2'],
+        'change_pct': members['change_pct'],
+    })
+    summary = flags.groupby('sector', observed=True).agg(
+        members=('change_pct', 'size'),
+        above_vwap_pct=('above_vwap', 'mean'),
+        touch_2s_pct=('touch_2s', 'mean'),
+        median_change_pct=('change_pct', 'median'),
+    )
+    summary[['above_vwap_pct', 'touch_2s_pct']] *= 100
+    return summary.sort_values('median_change_pct', ascending=False).reset_index()
+
+def top_movers(results, sector, n):
+    """業種内で前日比の絶対値が大きい順に n 銘柄"""
+    members = results[results['sector'] == sector]
+    order = members['change_pct'].abs().sort_values(ascending=False, na_position='last').index
+    return members.loc[order[:n]]
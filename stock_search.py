@@ -0,0 +1,134 @@
+"""銘柄検索インデックス（正規化した銘柄名・コードのn-gram転置インデックス）"""
+import heapq
+import unicodedata
+
+# カタカナ→ひらがな変換表（ァ〜ヶ）
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+# 名前の前方一致インデックスに登録する最大文字数
+NAME_PREFIX_LENGTH = 4
+
+# 一致の種類ごとの順位（小さいほど上位）
+RANK_CODE_EXACT = 0
+RANK_CODE_PREFIX = 1
+RANK_NAME_PREFIX = 2
+RANK_NAME_CONTAINS = 3
+
+def normalize(text):
+    """全角/半角・カタカナ/ひらがな・大文字/小文字・空白の違いを吸収"""
+    text = unicodedata.normalize('NFKC', str(text))
+    text = text.translate(KATAKANA_TO_HIRAGANA).lower()
+    return ''.join(text.split())
+
+def ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class StockSearchIndex:
+    """load_stock_data の銘柄表から一度だけ構築し、セッション間で共有する検索インデックス"""
+
+    def __init__(self, stock_df):
+        self.codes = [normalize(code) for code in stock_df['code']]
+        self.names = [normalize(name) for name in stock_df['name']]
+        self.markets = list(stock_df['market'])
+        self.sectors = list(stock_df['sector'])
+        self._sector_keys = [normalize(sector) for sector in self.sectors]
+        self._market_keys = [normalize(market) for market in self.markets]
+        # 同順位の中では名前の短い順・コード順
+        order = sorted(range(len(self.codes)), key=lambda i: (len(self.names[i]), self.codes[i]))
+        self._order_key = [0] * len(order)
+        for position, i in enumerate(order):
+            self._order_key[i] = position
+
+        # 1文字と2文字のn-gram → 行番号の集合（コード・名前用と業種・市場用）
+        self._name_postings = {}
+        self._attr_postings = {}
+        for i in range(len(self.codes)):
+            for postings, fields in ((self._name_postings, (self.codes[i], self.names[i])),
+                                     (self._attr_postings, (self._sector_keys[i], self._market_keys[i]))):
+                for field in fields:
+                    for gram in ngrams(field, 1) | ngrams(field, 2):
+                        postings.setdefault(gram, set()).add(i)
+
+        # コードと名前の前方一致（広いクエリでも上位だけ取り出せるようにする）
+        self._code_prefix = {}
+        self._name_prefix = {}
+        for i, (code, name) in enumerate(zip(self.codes, self.names)):
+            for length in range(1, len(code) + 1):
+                self._code_prefix.setdefault(code[:length], set()).add(i)
+            for length in range(1, min(len(name), NAME_PREFIX_LENGTH) + 1):
+                self._name_prefix.setdefault(name[:length], set()).add(i)
+
+        self._all_rows = frozenset(range(len(self.codes)))
+        self._by_market = {}
+        self._by_sector = {}
+        for i, (market, sector) in enumerate(zip(self.markets, self.sectors)):
+            self._by_market.setdefault(market, set()).add(i)
+            self._by_sector.setdefault(sector, set()).add(i)
+
+    @property
+    def market_names(self):
+        return sorted(self._by_market)
+
+    @property
+    def sector_names(self):
+        return sorted(sector for sector in self._by_sector if sector != '-')
+
+    def _candidates(self, key, postings):
+        """クエリの全n-gramを含む行（部分一致の候補）"""
+        grams = ngrams(key, 2) if len(key) > 1 else {key}
+        sets = sorted((postings.get(gram, set()) for gram in grams), key=len)
+        if not sets or not sets[0]:
+            return set()
+        return sets[0].intersection(*sets[1:])
+
+    def _rank(self, i, key):
+        """コード・名前での一致順位（一致しなければ None）"""
+        code, name = self.codes[i], self.names[i]
+        if code == key:
+            return (RANK_CODE_EXACT, 0, self._order_key[i])
+        if code.startswith(key):
+            return (RANK_CODE_PREFIX, 0, self._order_key[i])
+        position = name.find(key)
+        if position == 0:
+            return (RANK_NAME_PREFIX, 0, self._order_key[i])
+        if position > 0:
+            return (RANK_NAME_CONTAINS, position, self._order_key[i])
+        if key in code:
+            return (RANK_NAME_CONTAINS, 0, self._order_key[i])
+        return None
+
+    def search(self, query='', limit=20, market=None, sector=None):
+        """一致度順に上位 limit 件の行番号を返す（market/sector で絞り込み可能）"""
+        key = normalize(query)
+        rows = self._all_rows
+        if market:
+            rows = rows & self._by_market.get(market, set())
+        if sector:
+            rows = rows & self._by_sector.get(sector, set())
+        if not key:
+            return heapq.nsmallest(limit, rows, key=self.codes.__getitem__)
+
+        # コード・名前の前方一致だけで件数が足りれば残りの候補は順位付けしない
+        name_rows = self._candidates(key, self._name_postings) & rows
+        prefix_rows = name_rows & (self._code_prefix.get(key, set())
+                                   | self._name_prefix.get(key[:NAME_PREFIX_LENGTH], set()))
+        if len(prefix_rows) < limit:
+            prefix_rows = name_rows
+        ranked = []
+        for i in prefix_rows:
+            rank = self._rank(i, key)
+            if rank is not None:
+                ranked.append((rank, i))
+        hits = [i for _, i in heapq.nsmallest(limit, ranked)]
+
+        # 足りない分は業種名、市場区分での一致で補う
+        if len(hits) < limit:
+            attr_rows = (self._candidates(key, self._attr_postings) & rows) - set(hits)
+            for keys in (self._sector_keys, self._market_keys):
+                matched = [i for i in attr_rows if key in keys[i]]
+                matched = heapq.nsmallest(limit - len(hits), matched, key=self._order_key.__getitem__)
+                hits.extend(matched)
+                attr_rows -= set(matched)
+                if len(hits) >= limit:
+                    break
+        return hits
@@ -0,0 +1,45 @@
+"""取得結果のキャッシュ（FetchCoordinator）の鮮度の確認
+
+    python -m pytest test_market_data.py
+"""
+import time
+
+import pandas as pd
+
+from market_data import FetchCoordinator
+
+TTL = 0.05
+
+class TickingLoad:
+    """呼ばれるたびに1本新しい足を返す取得関数（自動更新の各回の取得を再現）"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return pd.DataFrame({'Close': [float(self.calls)]})
+
+def test_stale_while_revalidate_serves_previous_bar():
+    coordinator = FetchCoordinator(fresh_ttl=TTL, max_stale=60)
+    load = TickingLoad()
+    coordinator.get('7203.T', load)
+    time.sleep(TTL * 2)
+    value, status = coordinator.get('7203.T', load)
+    # 期限切れの直後は前回の足が返り、取り直しは裏で行われる
+    assert status == 'stale'
+    assert value['Close'].iloc[0] == 1
+
+def test_live_tick_returns_bar_fetched_on_that_tick():
+    coordinator = FetchCoordinator(fresh_ttl=60, max_stale=3600)
+    load = TickingLoad()
+    coordinator.get('7203.T', load, fresh_ttl=TTL, max_stale=0)
+    for _ in range(3):
+        time.sleep(TTL * 2)
+        value, status = coordinator.get('7203.T', load, fresh_ttl=TTL, max_stale=0)
+        assert status == 'miss'
+        assert value['Close'].iloc[0] == load.calls
+    # 期限内ならキャッシュから返す
+    value, status = coordinator.get('7203.T', load, fresh_ttl=TTL, max_stale=0)
+    assert status == 'hit'
+    assert value['Close'].iloc[0] == load.calls
@@ -0,0 +1,25 @@
+"""スキャン結果の集計（screener）の確認
+
+    python -m pytest test_screener.py
+"""
+import pandas as pd
+
+from screener import latest_session
+
+def scan_results(dates):
+    index = pd.DatetimeIndex(pd.to_datetime(dates)).tz_localize('Asia/Tokyo')
+    return pd.DataFrame({'ticker': [f"{1000 + i}.T" for i in range(len(dates))], 'date': index})
+
+def test_latest_session_ignores_few_tickers_on_forming_bar():
+    # 取引時間中にチャートを表示した2銘柄だけ当日の形成中の足まで更新されている
+    results = scan_results(['2025-07-30'] * 5 + ['2025-07-31'] * 2 + ['2025-07-29'])
+    current, stale = latest_session(results)
+    assert (current['date'] == pd.Timestamp('2025-07-30', tz='Asia/Tokyo')).all()
+    assert len(current) == 5
+    assert stale == 3
+
+def test_latest_session_prefers_newer_date_on_tie():
+    results = scan_results(['2025-07-30'] * 3 + ['2025-07-31'] * 3)
+    current, stale = latest_session(results)
+    assert (current['date'] == pd.Timestamp('2025-07-31', tz='Asia/Tokyo')).all()
+    assert stale == 3
@@ -0,0 +1,161 @@
+"""ストリーミングVWAPバンド（StreamingVWAPBands）とバッチ計算（calculate_vwap_bands）の一致、バーストアの差分更新の確認
+
+    python -m pytest test_vwap.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_store
+from bar_store import BarStore
+from market_data import OHLCV_COLUMNS, FakeFetcher
+from vwap import BAND_COLUMNS, StreamingVWAPBands, calculate_vwap_bands, update_vwap_bands
+
+PERIOD = 20
+
+def sample_bars(n=120):
+    return FakeFetcher().history('7203.T', period='1mo', interval='5m')[OHLCV_COLUMNS].iloc[:n]
+
+def batch_bands(df):
+    return calculate_vwap_bands(df.copy(), PERIOD)[BAND_COLUMNS].to_numpy()
+
+def assert_bands_equal(actual, expected):
+    # NaN の位置（計算に必要な本数に満たない足）も含めて一致すること
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, equal_nan=True)
+
+def test_matches_batch_including_warm_up():
+    df = sample_bars()
+    values = StreamingVWAPBands(PERIOD).extend(df)
+    expected = batch_bands(df)
+    assert_bands_equal(values, expected)
+    # VWAPは period 本目から、偏差の移動和を使うバンドは 2*period-1 本目から値が出る
+    assert np.isnan(values[:PERIOD - 1]).all()
+    assert not np.isnan(values[PERIOD - 1, 0])
+    assert np.isnan(values[:2 * PERIOD - 2, 1:]).all()
+    assert not np.isnan(values[2 * PERIOD - 2:]).any()
+
+def test_push_returns_none_until_period_bars():
+    engine = StreamingVWAPBands(PERIOD)
+    df = sample_bars(PERIOD)
+    results = [engine.push(row.High, row.Low, row.Close, row.Volume, ts) for ts, row in df.iterrows()]
+    assert all(result is None for result in results[:-1])
+    assert results[-1] is not None
+
+def test_zero_volume_window():
+    df = sample_bars()
+    # period 本を超えて出来高0が続くと VWAP は 0/0 で未定義になり、その後は元に戻る
+    df.iloc[40:70, df.columns.get_loc('Volume')] = 0
+    values = StreamingVWAPBands(PERIOD).extend(df)
+    expected = batch_bands(df)
+    assert_bands_equal(values, expected)
+    assert np.isnan(values[70 - 1, 0])
+    assert not np.isnan(values[-1]).any()
+
+def test_same_timestamp_replaces_forming_bar():
+    df = sample_bars()
+    engine = StreamingVWAPBands(PERIOD)
+    engine.extend(df)
+    # 形成中の最終足が更新された（高値・終値・出来高が増えた）
+    revised = df.copy()
+    last = revised.index[-1]
+    revised.loc[last, ['High', 'Close']] *= 1.02
+    revised.loc[last, 'Volume'] += 50_000
+    row = revised.iloc[-1]
+    bands = engine.push(row.High, row.Low, row.Close, row.Volume, last)
+    expected = batch_bands(revised)[-1]
+    np.testing.assert_allclose([bands[col] for col in BAND_COLUMNS], expected, rtol=1e-9)
+
+def test_resync_after_many_wraps():
+    df = sample_bars(n=1000)
+    values = StreamingVWAPBands(PERIOD).extend(df)
+    assert_bands_equal(values, batch_bands(df))
+
+def test_update_vwap_bands_recomputes_only_tail():
+    df = sample_bars()
+    head = calculate_vwap_bands(df.iloc[:-5].copy(), PERIOD)
+    merged = pd.concat([head, df.iloc[-5:]])
+    assert_bands_equal(update_vwap_bands(merged, 5, PERIOD)[BAND_COLUMNS].to_numpy(), batch_bands(df))
+
+class SliceFetcher:
+    """決まった系列のうち end 時刻までを返すフェッチャー（取得ごとに足が増えていく様子を再現）"""
+
+    def __init__(self, df, end):
+        self.df = df
+        self.end = end
+
+    def history(self, ticker, period='3mo', interval='1d', start=None):
+        df = self.df[self.df.index <= self.end]
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start).tz_localize(df.index.tz)]
+        return df.copy()
+
+@pytest.mark.parametrize('interval', ['1d', '5m'])
+def test_bar_store_incremental_refresh(tmp_path, monkeypatch, interval):
+    df = FakeFetcher().history('7203.T', period='3mo' if interval == '1d' else '1mo', interval=interval)
+    store = BarStore(root=str(tmp_path), max_age=0)
+    store.refresh('7203.T', '1mo', interval, SliceFetcher(df, df.index[-30]))
+
+    # 以降の更新は保持している計算器に新しい足を追加するだけで、末尾の再計算は行わない
+    def no_recompute(*args, **kwargs):
+        raise AssertionError('update_vwap_bands should not be called')
+    monkeypatch.setattr(bar_store, 'update_vwap_bands', no_recompute)
+    for end in df.index[-29:]:
+        # 形成中の最終足（値が途中）を取ってから確定した足を取る
+        partial = df.copy()
+        partial.loc[end, 'Close'] = partial.loc[end, 'Open']
+        partial.loc[end, 'Volume'] //= 2
+        store.refresh('7203.T', '1mo', interval, SliceFetcher(partial, end))
+        refreshed = store.refresh('7203.T', '1mo', interval, SliceFetcher(df, end))
+    stored, _ = store.load('7203.T', interval)
+    np.testing.assert_array_equal(stored[OHLCV_COLUMNS].to_numpy(), df.loc[stored.index, OHLCV_COLUMNS].to_numpy())
+    assert_bands_equal(stored[BAND_COLUMNS].to_numpy(), batch_bands(stored))
+    assert refreshed.index[-1] == df.index[-1]
+
+class CountingFetcher(SliceFetcher):
+    """全期間の取得（start なし）の回数を数える"""
+
+    def __init__(self, df, end):
+        super().__init__(df, end)
+        self.full_fetches = 0
+
+    def history(self, ticker, period='3mo', interval='1d', start=None):
+        if start is None:
+            self.full_fetches += 1
+        return super().history(ticker, period, interval, start)
+
+def test_bar_store_refetches_after_split(tmp_path):
+    df = FakeFetcher().history('7203.T', period='3mo', interval='1d')
+    store = BarStore(root=str(tmp_path), max_age=0)
+    store.refresh('7203.T', '3mo', '1d', SliceFetcher(df, df.index[-5]))
+
+    # 2分割：取得元は分割日より前の足をすべて1/2に調整し直す
+    split_day = df.index[-3]
+    adjusted = df.copy()
+    before = adjusted.index < split_day
+    adjusted.loc[before, ['Open', 'High', 'Low', 'Close']] /= 2
+    adjusted.loc[before, 'Volume'] *= 2
+    adjusted.loc[split_day, 'Stock Splits'] = 2.0
+    fetcher = CountingFetcher(adjusted, df.index[-1])
+    store.refresh('7203.T', '3mo', '1d', fetcher)
+    stored, _ = store.load('7203.T', '1d')
+    assert fetcher.full_fetches == 1
+    np.testing.assert_array_equal(stored[OHLCV_COLUMNS].to_numpy(), adjusted.loc[stored.index, OHLCV_COLUMNS].to_numpy())
+    assert_bands_equal(stored[BAND_COLUMNS].to_numpy(), batch_bands(stored))
+
+    # 保存済みの分割が差分に含まれても取得し直さない
+    store.refresh('7203.T', '3mo', '1d', fetcher)
+    assert fetcher.full_fetches == 1
+
+def test_bar_store_trims_to_retention(tmp_path):
+    df = FakeFetcher().history('7203.T', period='1mo', interval='5m')
+    store = BarStore(root=str(tmp_path), max_age=0, retention={'5m': '5d'})
+    store.refresh('7203.T', '5d', '5m', SliceFetcher(df, df.index[-200]))
+    for end in df.index[-199::20]:
+        store.refresh('7203.T', '5d', '5m', SliceFetcher(df, end))
+    stored, covered_from = store.load('7203.T', '5m')
+    # 最終バーから5日分（7日さかのぼる）とバンド計算用の直前の足だけ残る
+    cutoff = stored.index[-1] - pd.DateOffset(days=7)
+    assert (stored.index < cutoff).sum() == bar_store.BAND_LOOKBACK
+    assert covered_from == stored.index[0]
+    np.testing.assert_array_equal(stored[OHLCV_COLUMNS].to_numpy(), df.loc[stored.index, OHLCV_COLUMNS].to_numpy())
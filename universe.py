@@ -0,0 +1,119 @@
+"""銘柄ユニバース（銘柄一覧CSVの読み込みとスナップショット、ticker→銘柄情報の参照表）"""
+import hashlib
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+StockInfo = namedtuple('StockInfo', ['ticker', 'code', 'name', 'market', 'sector'])
+
+# 銘柄一覧CSV（JPXの上場銘柄一覧）の列名 → 銘柄表の列名
+CSV_COLUMNS = {
+    'コード': 'code',
+    '銘柄名': 'name',
+    '市場・商品区分': 'market',
+    '33業種区分': 'sector',
+}
+
+# 対象にする市場区分（ETF・REIT・出資証券などは除く）
+UNIVERSE_MARKETS = ['プライム（内国株式）', 'スタンダード（内国株式）', 'グロース（内国株式）']
+
+# スナップショットのスキーマメタデータに保存する元CSVの情報
+SOURCE_SIZE_KEY = b'keep_stock.source_size'
+SOURCE_MTIME_KEY = b'keep_stock.source_mtime_ns'
+SOURCE_HASH_KEY = b'keep_stock.source_sha256'
+# 銘柄表の列構成を変えたら上げる（古いスナップショットを使わないように）
+SNAPSHOT_VERSION_KEY = b'keep_stock.universe_version'
+SNAPSHOT_VERSION = b'1'
+
+def read_universe_csv(csv_path):
+    """銘柄一覧CSVを読み込んで対象市場の銘柄表を作る"""
+    df = pd.read_csv(csv_path, usecols=list(CSV_COLUMNS), dtype={'コード': str})
+    df = df.rename(columns=CSV_COLUMNS)[list(CSV_COLUMNS.values())]
+    df = df[df['market'].isin(UNIVERSE_MARKETS)].reset_index(drop=True)
+    df['code'] = df['code'].str.zfill(4)
+    df['ticker'] = df['code'] + '.T'
+    # 市場区分・業種は種類が少ないのでカテゴリ型で持つ
+    return df.astype({'market': 'category', 'sector': 'category'})
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def default_snapshot_path(csv_path):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.environ.get('STOCK_DATA_DIR', 'data'), 'universe', f"{name}.arrow")
+
+def save_universe_snapshot(df, snapshot_path, stat, digest):
+    """銘柄表を元CSVの情報付きのArrow IPCファイルに保存（一時ファイル経由で置き換え）"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_SIZE_KEY] = str(stat.st_size).encode()
+    metadata[SOURCE_MTIME_KEY] = str(stat.st_mtime_ns).encode()
+    metadata[SOURCE_HASH_KEY] = digest.encode()
+    metadata[SNAPSHOT_VERSION_KEY] = SNAPSHOT_VERSION
+    table = table.replace_schema_metadata(metadata)
+    os.makedirs(os.path.dirname(snapshot_path) or '.', exist_ok=True)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # 非圧縮にしてメモリマップでそのまま読めるようにする
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, snapshot_path)
+
+def load_universe(csv_path='data_j.csv', snapshot_path=None):
+    """銘柄表を読み込む（元CSVが変わっていなければスナップショットをメモリマップで読む）
+
+    サイズと更新日時が一致すればそのまま使い、更新日時だけ変わった場合は
+    内容のハッシュを比べてから使う。CSVが変わっていれば読み直して保存し直す。
+    """
+    snapshot_path = snapshot_path or default_snapshot_path(csv_path)
+    stat = os.stat(csv_path)
+    table = None
+    if os.path.exists(snapshot_path):
+        try:
+            table = pa.ipc.open_file(pa.memory_map(snapshot_path)).read_all()
+        except (OSError, pa.ArrowInvalid):
+            table = None
+    metadata = (table.schema.metadata or {}) if table is not None else {}
+    if metadata.get(SNAPSHOT_VERSION_KEY) != SNAPSHOT_VERSION:
+        table, metadata = None, {}
+
+    if (metadata.get(SOURCE_SIZE_KEY) == str(stat.st_size).encode()
+            and metadata.get(SOURCE_MTIME_KEY) == str(stat.st_mtime_ns).encode()):
+        return table.to_pandas()
+
+    digest = file_sha256(csv_path)
+    if table is not None and metadata.get(SOURCE_HASH_KEY) == digest.encode():
+        df = table.to_pandas()
+    else:
+        df = read_universe_csv(csv_path)
+    try:
+        save_universe_snapshot(df, snapshot_path, stat, digest)
+    except OSError:
+        # 保存できない環境でもCSVから読んだ銘柄表は使える
+        pass
+    return df
+
+def build_stock_info_map(stock_df):
+    """銘柄表から ticker→StockInfo の読み取り専用の辞書を作成"""
+    info_map = {
+        ticker: StockInfo(ticker, code, name, market, sector)
+        for ticker, code, name, market, sector in zip(
+            stock_df['ticker'], stock_df['code'], stock_df['name'],
+            stock_df['market'], stock_df['sector']
+        )
+    }
+    return MappingProxyType(info_map)
+
+def lookup_stock_info(info_map, tickers):
+    """複数銘柄の情報をまとめて引く（表にない銘柄はティッカーから補完）"""
+    return [
+        info_map.get(ticker) or StockInfo(ticker, ticker.replace('.T', ''), ticker, '', '')
+        for ticker in tickers
+    ]
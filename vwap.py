@@ -0,0 +1,256 @@
+"""VWAPバンド計算"""
+import numpy as np
+import pandas as pd
+
+# calculate_vwap_bands が付与する列
+BAND_COLUMNS = ['vwap', 'vwap_upper_1', 'vwap_lower_1', 'vwap_upper_2', 'vwap_lower_2']
+
+def calculate_vwap_bands(df, period=20):
+    """TradingView風のVWAPバンド計算（Pine Scriptベース）"""
+    if len(df) < period:
+        return df
+    
+    # Typical Price (hlc3)
+    typical_price = (df['High'] + df['Low'] + df['Close']) / 3
+    
+    # Price * Volume
+    price_volume = typical_price * df['Volume']
+    
+    # 指定期間の移動平均を使用してVWAP計算
+    sum_pv = price_volume.rolling(window=period).sum()
+    sum_vol = df['Volume'].rolling(window=period).sum()
+    vwap_value = sum_pv / sum_vol
+    
+    # VWAP基準の偏差計算
+    deviation = typical_price - vwap_value
+    squared_dev = deviation ** 2
+    
+    # 加重標準偏差計算
+    weighted_squared_dev = squared_dev * df['Volume']
+    sum_weighted_squared_dev = weighted_squared_dev.rolling(window=period).sum()
+    variance = sum_weighted_squared_dev / sum_vol
+    std_dev = np.sqrt(variance)
+    
+    # VWAPとバンドを計算
+    df['vwap'] = vwap_value
+    df['vwap_upper_1'] = vwap_value + std_dev
+    df['vwap_lower_1'] = vwap_value - std_dev
+    df['vwap_upper_2'] = vwap_value + 2 * std_dev
+    df['vwap_lower_2'] = vwap_value - 2 * std_dev
+    
+    return df
+
+class StreamingVWAPBands:
+    """直近period本をリングバッファに保持し、1本ごとにO(1)でVWAPバンドを更新する
+
+    calculate_vwap_bands と同じく、各足の偏差はその足の時点のVWAPから取り、
+    ΣV・ΣPV・Σ(V×偏差²) をリングバッファ上の移動和として保持する。
+    リングバッファが一周するたびに和を計算し直して誤差の蓄積を防ぐ。
+    """
+
+    def __init__(self, period=20):
+        self.period = period
+        self._tp = np.zeros(period)
+        self._vol = np.zeros(period)
+        # 各足の V×偏差²（その足でVWAPが未確定なら NaN）
+        self._wsd = np.full(period, np.nan)
+        self._count = 0
+        self._pos = 0
+        self._sum_v = 0.0
+        self._sum_pv = 0.0
+        self._sum_wsd = 0.0
+        # 空きスロットも NaN として数える
+        self._nan_wsd = period
+        self.last_timestamp = None
+
+    def _remove(self, slot):
+        self._sum_v -= self._vol[slot]
+        self._sum_pv -= self._tp[slot] * self._vol[slot]
+        if np.isnan(self._wsd[slot]):
+            self._nan_wsd -= 1
+        else:
+            self._sum_wsd -= self._wsd[slot]
+
+    def _vwap(self):
+        if self._count < self.period or self._sum_v == 0:
+            return np.nan
+        return self._sum_pv / self._sum_v
+
+    def _resync(self):
+        self._sum_v = self._vol.sum()
+        self._sum_pv = (self._tp * self._vol).sum()
+        self._sum_wsd = np.nansum(self._wsd)
+        self._nan_wsd = int(np.isnan(self._wsd).sum())
+
+    def push(self, high, low, close, volume, timestamp=None):
+        """1本追加してバンドを返す（直前と同じtimestampなら形成中の足として置き換える）"""
+        tp = (high + low + close) / 3
+        if timestamp is not None and self._count and timestamp == self.last_timestamp:
+            slot = (self._pos - 1) % self.period
+        else:
+            slot = self._pos
+            self._pos = (self._pos + 1) % self.period
+            self._count += 1
+        self._remove(slot)
+
+        self._tp[slot] = tp
+        self._vol[slot] = volume
+        self._sum_v += volume
+        self._sum_pv += tp * volume
+        vwap_value = self._vwap()
+        wsd = (tp - vwap_value) ** 2 * volume
+        self._wsd[slot] = wsd
+        if np.isnan(wsd):
+            self._nan_wsd += 1
+        else:
+            self._sum_wsd += wsd
+        self.last_timestamp = timestamp
+        if self._pos == 0:
+            self._resync()
+        return self.bands()
+
+    def bands(self):
+        """現在のVWAPとバンド（計算に必要な本数に満たない間は None）"""
+        if self._count < self.period:
+            return None
+        vwap_value = self._vwap()
+        if self._nan_wsd or self._sum_v == 0:
+            std_dev = np.nan
+        else:
+            # 引き算の丸め誤差で僅かに負になるのを防ぐ
+            std_dev = np.sqrt(max(self._sum_wsd / self._sum_v, 0.0))
+        return {
+            'vwap': vwap_value,
+            'vwap_upper_1': vwap_value + std_dev,
+            'vwap_lower_1': vwap_value - std_dev,
+            'vwap_upper_2': vwap_value + 2 * std_dev,
+            'vwap_lower_2': vwap_value - 2 * std_dev,
+        }
+
+    def extend(self, df):
+        """OHLCVフレームの全行を順に追加し、BAND_COLUMNS順の (行数, 5) 配列を返す"""
+        out = np.full((len(df), len(BAND_COLUMNS)), np.nan)
+        rows = zip(df.index, df['High'].to_numpy(), df['Low'].to_numpy(),
+                   df['Close'].to_numpy(), df['Volume'].to_numpy())
+        for i, (timestamp, high, low, close, volume) in enumerate(rows):
+            bands = self.push(high, low, close, volume, timestamp)
+            if bands is not None:
+                out[i] = [bands[col] for col in BAND_COLUMNS]
+        return out
+
+def update_vwap_bands(df, n_new, period=20):
+    """末尾に追加・更新されたn_new本の影響範囲だけVWAPバンドを再計算"""
+    if n_new <= 0:
+        return df
+    # 末尾n_new本のバンドに影響するのは、偏差の移動和のためのVWAPを含めて直前 2*(period-1) 本まで
+    lookback = n_new + 2 * (period - 1)
+    if any(col not in df.columns for col in BAND_COLUMNS) or lookback >= len(df):
+        return calculate_vwap_bands(df, period)
+    
+    engine = StreamingVWAPBands(period)
+    values = engine.extend(df.iloc[-lookback:])
+    columns = [df.columns.get_loc(col) for col in BAND_COLUMNS]
+    df.iloc[-n_new:, columns] = values[-n_new:]
+    return df
+
+# compute_band_panel が返すタッチ判定（列名, 判定に使うバンド）
+TOUCH_COLUMNS = {
+    'touch_u2': 'vwap_upper_2',
+    'touch_l2': 'vwap_lower_2',
+    'touch_u1': 'vwap_upper_1',
+    'touch_l1': 'vwap_lower_1',
+}
+
+def band_frame(df):
+    """計算済みのバンド列（バーストアに保存したもの）にタッチ判定を加えたフレーム
+
+    BandPanel.ticker_frame と同じ列を返す。バンドの列がなければ None。
+    """
+    if not all(col in df.columns for col in BAND_COLUMNS):
+        return None
+    bands = df[BAND_COLUMNS].astype(float)
+    high = df['High'].to_numpy(dtype=float)
+    low = df['Low'].to_numpy(dtype=float)
+    for touch_col, band_col in TOUCH_COLUMNS.items():
+        band = bands[band_col].to_numpy()
+        bands[touch_col] = (high >= band) & (low <= band)
+    return bands
+
+def rolling_sum(values, period):
+    """時間軸(axis=0)方向の移動和（窓内にNaNがあればNaN、先頭period-1行もNaN）"""
+    out = np.full(values.shape, np.nan)
+    if len(values) >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(values, period, axis=0)
+        out[period - 1:] = windows.sum(axis=-1)
+    return out
+
+def compute_band_panel(high, low, close, volume, period=20):
+    """時間×銘柄の2次元配列から全銘柄のVWAPバンドとタッチ判定を一括計算
+
+    calculate_vwap_bands と同じ式をNumPyでまとめて計算し、
+    BAND_COLUMNS と TOUCH_COLUMNS の各名前→(時間, 銘柄) 配列の辞書を返す。
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        typical_price = (high + low + close) / 3
+        sum_pv = rolling_sum(typical_price * volume, period)
+        sum_vol = rolling_sum(volume, period)
+        vwap_value = sum_pv / sum_vol
+        weighted_squared_dev = (typical_price - vwap_value) ** 2 * volume
+        std_dev = np.sqrt(rolling_sum(weighted_squared_dev, period) / sum_vol)
+
+    panel = {
+        'vwap': vwap_value,
+        'vwap_upper_1': vwap_value + std_dev,
+        'vwap_lower_1': vwap_value - std_dev,
+        'vwap_upper_2': vwap_value + 2 * std_dev,
+        'vwap_lower_2': vwap_value - 2 * std_dev,
+    }
+    # 高値と安値の間にバンドがあればタッチ（NaNとの比較は False）
+    for touch_col, band_col in TOUCH_COLUMNS.items():
+        panel[touch_col] = (high >= panel[band_col]) & (low <= panel[band_col])
+    return panel
+
+class BandPanel:
+    """複数銘柄のVWAPバンドとタッチ判定（チャート描画とスクリーナーで共用）
+
+    各銘柄の系列は最新の足を最終行に揃えて（末尾揃えで）格納し、
+    足りない先頭部分は NaN / False で埋める。
+    """
+
+    def __init__(self, tickers, indexes, arrays):
+        self.tickers = list(tickers)
+        self.indexes = indexes
+        self.arrays = arrays
+        self._columns = {ticker: j for j, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def from_frames(cls, frames, period=20):
+        """{ticker: OHLCVフレーム} から一括計算（None や空のフレームは除外）"""
+        frames = {ticker: df for ticker, df in frames.items() if df is not None and not df.empty}
+        length = max((len(df) for df in frames.values()), default=0)
+        ohlcv = {col: np.full((length, len(frames)), np.nan) for col in ('High', 'Low', 'Close', 'Volume')}
+        for j, df in enumerate(frames.values()):
+            for col, values in ohlcv.items():
+                values[length - len(df):, j] = df[col].to_numpy(dtype=float)
+        arrays = compute_band_panel(ohlcv['High'], ohlcv['Low'], ohlcv['Close'], ohlcv['Volume'], period)
+        arrays.update(ohlcv)
+        indexes = {ticker: df.index for ticker, df in frames.items()}
+        return cls(frames.keys(), indexes, arrays)
+
+    def __contains__(self, ticker):
+        return ticker in self._columns
+
+    def ticker_frame(self, ticker):
+        """1銘柄分のバンドとタッチ判定を元のインデックス付きで取り出す"""
+        j = self._columns[ticker]
+        index = self.indexes[ticker]
+        start = len(self.arrays['vwap']) - len(index)
+        columns = BAND_COLUMNS + list(TOUCH_COLUMNS)
+        return pd.DataFrame({col: self.arrays[col][start:, j] for col in columns}, index=index)
+
+    def latest(self):
+        """各銘柄の最新足のバンドとタッチ判定（1行1銘柄）"""
+        columns = ['Close'] + BAND_COLUMNS + list(TOUCH_COLUMNS)
+        data = {col: self.arrays[col][-1] if len(self.arrays[col]) else [] for col in columns}
+        data['date'] = [self.indexes[ticker][-1] for ticker in self.tickers]
+        return pd.DataFrame(data, index=pd.Index(self.tickers, name='ticker'))